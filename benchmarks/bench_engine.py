@@ -0,0 +1,64 @@
+"""Computer opponent search benchmark.
+
+Searches a set of test positions to a fixed depth, checks the move found
+against the expected one and reports nodes per second, then times a search
+with the game's time budget in the worker process the game uses:
+
+    python -m benchmarks.bench_engine
+    python -m benchmarks.bench_engine --depth-offset 1
+"""
+import argparse
+import time
+
+import chess
+
+import engine
+
+# (name, FEN, expected best move, depth in plies)
+POSITIONS = [
+    ("back rank mate", "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", "d1d8", 2),
+    ("scholar's mate", "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4", "h5f7", 2),
+    ("queen mate", "7k/8/6K1/8/8/8/8/Q7 w - - 0 1", "a1a8", 2),
+    ("hanging queen", "rnb1kbnr/pppp1ppp/8/4p1q1/4P3/3P4/PPP2PPP/RNBQKBNR w KQkq - 1 3", "c1g5", 3),
+    ("mate in two", "r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - 1 1", "d5f6", 4),
+    ("start position", chess.STARTING_FEN, None, 4),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", None, 3),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--depth-offset', type=int, default=0, help='plies added to every fixed depth')
+    parser.add_argument('--time-budget', type=float, default=2.0, help='seconds for the worker process search')
+    args = parser.parse_args()
+
+    total_nodes, total_seconds, failures = 0, 0.0, 0
+    print(f"{'position':<16}{'depth':>6}{'move':>7}{'score':>8}{'nodes':>9}{'nps':>8}")
+    for name, fen, expected, depth in POSITIONS:
+        # A fresh search per position, so no position benefits from another's table
+        result = engine.Search().run(chess.Board(fen), max_depth=depth + args.depth_offset)
+        total_nodes += result['nodes']
+        total_seconds += result['seconds']
+        move = result['move'].uci()
+        mark = ''
+        if expected:
+            mark = 'ok' if move == expected else f'expected {expected}'
+            failures += move != expected
+        print(f"{name:<16}{result['depth']:>6}{move:>7}{result['score']:>8}{result['nodes']:>9}"
+              f"{result['nodes'] / result['seconds']:>8.0f}  {mark}")
+    print(f"Total: {total_nodes} nodes in {total_seconds:.2f} s, {total_nodes / total_seconds:.0f} nodes/s, {failures} wrong")
+
+    worker = engine.EngineProcess()
+    start = time.perf_counter()
+    worker.start()
+    worker.think(chess.Board(), args.time_budget)
+    result = worker.poll()
+    while result is None:
+        time.sleep(0.01)
+        result = worker.poll()
+    elapsed = time.perf_counter() - start
+    worker.close()
+    print(f"Worker process: {result['move'].uci()} at depth {result['depth']} in {elapsed:.2f} s "
+          f"including process start ({result['nodes'] / result['seconds']:.0f} nodes/s)")
+
+if __name__ == "__main__":
+    main()
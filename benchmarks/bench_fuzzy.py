@@ -0,0 +1,72 @@
+"""Out-of-vocabulary word fallback benchmark.
+
+Times the phonetic BK-tree lookup in second.py, with and without its memo
+cache, against the substring scan over NUMBER_SOUNDS it replaced, and shows
+what each one reads a sample of misrecognized words as:
+
+    python -m benchmarks.bench_fuzzy
+"""
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks.bench_normalize import load_second
+
+# Misspellings the recognizer produces when the grammar is off, plus words that should stay unmatched
+WORDS = [
+    "knite", "nite", "sevan", "eighth", "fives", "sixes", "bishap", "bishup", "queene",
+    "kings", "rooks", "castel", "castling", "kingsyde", "queensyde", "fourr", "twoo",
+    "threes", "sevens", "please", "hello", "thanks", "move", "check", "eighteen", "tunes",
+    "xylophone", "what", "there", "sixteen",
+]
+
+def partial_scan(second):
+    """The substring scan used before the BK-tree, e.g. "eighth" contains "eight" -> 8"""
+    sounds = [(sound, digit) for sound, digit in second.NUMBER_SOUNDS.items() if len(sound) >= 3 and ' ' not in sound]
+
+    def lookup(word):
+        for sound, digit in sounds:
+            if sound in word and len(word) <= len(sound) + 2:
+                return digit
+        return None
+    return lookup
+
+def time_lookup(lookup, words, rounds, before_each=None):
+    timings = []
+    for _ in range(rounds):
+        for word in words:
+            if before_each:
+                before_each()
+            start = time.perf_counter_ns()
+            lookup(word)
+            timings.append((time.perf_counter_ns() - start) / 1000.0)
+    timings.sort()
+    return timings
+
+def main():
+    default_source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'second.py')
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default=default_source, help='second.py to benchmark')
+    parser.add_argument('--rounds', type=int, default=500, help='passes over the word list')
+    args = parser.parse_args()
+
+    second = load_second(args.source)
+    scan = partial_scan(second)
+    print(f"Indexed keys: {second.FUZZY_INDEX.size} for {len(second.FUZZY_VOCABULARY)} words")
+    print(f"{'word':<12}{'key':<8}{'scan':<8}fuzzy")
+    for word in WORDS:
+        print(f"{word:<12}{second.phonetic_key(word):<8}{str(scan(word)):<8}{second.fuzzy_lexicon_word(word)}")
+    print()
+
+    results = {
+        'substring scan': time_lookup(scan, WORDS, args.rounds),
+        'BK-tree': time_lookup(second.fuzzy_lexicon_word, WORDS, args.rounds, second.fuzzy_cache.clear),
+        'BK-tree memoized': time_lookup(second.fuzzy_lexicon_word, WORDS, args.rounds),
+    }
+    for name, timings in results.items():
+        print(f"{name:<18} mean {statistics.fmean(timings):6.2f} us  "
+              f"p50 {timings[len(timings) // 2]:6.2f} us  p95 {timings[int(len(timings) * 0.95)]:6.2f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Decoder speed with the open vocabulary versus the legal-move grammar.
+
+Decodes every WAV file (16 kHz, mono, 16-bit) in a directory twice, once with a
+plain recognizer and once with the grammar of the position the utterance was
+spoken in, and reports decode time and real-time factor for both. Positions come
+from an optional labels.json in the same directory:
+
+    {"e4.wav": {"fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", "move": "e2e4"}}
+
+Files without a label are decoded against the starting position.
+
+    python -m benchmarks.bench_grammar --model path/to/vosk-model samples/
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import wave
+
+import chess
+import vosk
+
+import second
+
+def decode(model, wav_path, grammar=None):
+    """Decode a WAV file and return (text, decode seconds, audio seconds)"""
+    with wave.open(wav_path, 'rb') as wav:
+        audio_seconds = wav.getnframes() / wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    
+    start = time.perf_counter()
+    if grammar:
+        rec = vosk.KaldiRecognizer(model, second.SAMPLE_RATE, grammar)
+    else:
+        rec = vosk.KaldiRecognizer(model, second.SAMPLE_RATE)
+    for offset in range(0, len(frames), 8000):
+        rec.AcceptWaveform(frames[offset:offset + 8000])
+    text = json.loads(rec.FinalResult()).get("text", "")
+    return text, time.perf_counter() - start, audio_seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('samples', help='directory of WAV files')
+    parser.add_argument('--model', default=os.environ.get('VOSK_MODEL_PATH'), help='Vosk model directory')
+    args = parser.parse_args()
+    
+    second.DEBUG = False
+    vosk.SetLogLevel(-1)
+    model = vosk.Model(args.model)
+    
+    labels_path = os.path.join(args.samples, 'labels.json')
+    labels = {}
+    if os.path.exists(labels_path):
+        with open(labels_path) as f:
+            labels = json.load(f)
+    
+    results = {'open': [], 'grammar': []}
+    audio_total = 0.0
+    for name in sorted(os.listdir(args.samples)):
+        if not name.endswith('.wav'):
+            continue
+        path = os.path.join(args.samples, name)
+        position = chess.Board(labels.get(name, {}).get('fen', chess.STARTING_FEN))
+        
+        open_text, open_time, audio_seconds = decode(model, path)
+        grammar_text, grammar_time, _ = decode(model, path, second.move_grammar(position))
+        results['open'].append(open_time)
+        results['grammar'].append(grammar_time)
+        audio_total += audio_seconds
+        print(f"{name}: open {open_time * 1000:.0f} ms '{open_text}' | grammar {grammar_time * 1000:.0f} ms '{grammar_text}'")
+    
+    if not audio_total:
+        print("No WAV files found")
+        return
+    for mode, timings in results.items():
+        print(f"{mode:8} mean {statistics.fmean(timings) * 1000:.0f} ms, real-time factor {sum(timings) / audio_total:.3f}")
+
+if __name__ == "__main__":
+    main()
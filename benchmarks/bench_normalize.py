@@ -0,0 +1,75 @@
+"""Per-utterance speech normalization benchmark.
+
+Times filter_repeated_words -> preprocess_speech_input -> normalize_text over a
+corpus of typical recognizer outputs. The normalization cache is cleared before each
+utterance, so the main figures time the normalizer itself; lookups that hit the cache
+are reported on a separate line. Pass --source to time another copy of second.py,
+for example the version before a change:
+
+    git show HEAD~1:second.py > /tmp/second_before.py
+    python -m benchmarks.bench_normalize --source /tmp/second_before.py
+    python -m benchmarks.bench_normalize
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+CORPUS = [
+    "e four", "e2 to e4", "knight to f three", "night to f3", "pawn to e four",
+    "castle king side", "castle queen side", "long castle", "short castle", "be tree",
+    "bishop to see for", "queen to the five", "rook to a one", "e two e four", "castle",
+    "d four", "see five", "knight f three", "bishop be five", "g to g four",
+    "queen takes d eight", "king to e two", "a to a four", "knife to see three",
+    "ef tree", "castles kingside", "e2e4", "queen side castle", "rook to d one",
+    "pawn to h for", "the the knight to to f three", "bishop takes takes see six",
+]
+
+def load_second(path):
+    spec = importlib.util.spec_from_file_location('second_under_test', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.DEBUG = False
+    return module
+
+def main():
+    default_source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'second.py')
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default=default_source, help='second.py to benchmark')
+    parser.add_argument('--rounds', type=int, default=200, help='passes over the corpus')
+    args = parser.parse_args()
+    
+    second = load_second(args.source)
+    # Versions from before the cache was added have none to clear
+    cache = getattr(second, 'normalization_cache', None)
+    timings = []
+    cached_timings = []
+    for _ in range(args.rounds):
+        for utterance in CORPUS:
+            if cache is not None:
+                cache.clear()
+            timings.append(time_utterance(second, utterance))
+            cached_timings.append(time_utterance(second, utterance))
+    
+    timings.sort()
+    print(f"Source: {args.source}")
+    print(f"Utterances timed: {len(timings)}")
+    print(f"Mean: {statistics.fmean(timings):.1f} us")
+    print(f"p50:  {timings[len(timings) // 2]:.1f} us")
+    print(f"p95:  {timings[int(len(timings) * 0.95)]:.1f} us")
+    if cache is not None:
+        print(f"Cached lookups: mean {statistics.fmean(cached_timings):.1f} us")
+
+def time_utterance(second, utterance):
+    """Microseconds to normalize one utterance the way the listener does"""
+    start = time.perf_counter_ns()
+    text = second.filter_repeated_words(utterance)
+    text = second.preprocess_speech_input(text)
+    second.normalize_text(text)
+    return (time.perf_counter_ns() - start) / 1000.0
+
+if __name__ == "__main__":
+    main()
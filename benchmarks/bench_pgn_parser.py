@@ -0,0 +1,123 @@
+"""Throughput and correctness of the text-to-move parser over real games.
+
+Streams a PGN file one game at a time. For every position it generates the
+spoken forms of each legal move ("e four", "knight to f three", "e two to e
+four", "castle kingside", ...) with spoken_move_phrases(), then runs them
+through normalize_text/parse_command logic in a pool of worker processes, one
+per core. Only a bounded number of position batches is in flight at once, so
+memory stays flat however large the PGN file is.
+
+Reports parses per second plus, per phrase template, the ambiguity rate (more
+than one legal move matched) and the mis-resolution rate (the parser picked a
+different move or none). The phrases are the grammar's own, which the parser
+resolves by lookup, so that step is switched off unless --grammar-phrases is
+given and the rates measure the parsing heuristics.
+
+    python -m benchmarks.bench_pgn_parser games.pgn --max-games 1000
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import time
+
+import chess
+import chess.pgn
+
+BATCH_POSITIONS = 64
+
+def position_batches(pgn_path, max_games=None):
+    """Yield lists of FENs, reading one game at a time"""
+    batch = []
+    games = 0
+    with open(pgn_path, encoding='utf-8', errors='replace') as pgn:
+        while max_games is None or games < max_games:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            games += 1
+            position = game.board()
+            for move in game.mainline_moves():
+                batch.append(position.fen())
+                if len(batch) == BATCH_POSITIONS:
+                    yield batch
+                    batch = []
+                position.push(move)
+    if batch:
+        yield batch
+
+def parse_batch(fens, grammar_phrases=False):
+    """Worker: parse every spoken form of every legal move; returns per-template tallies"""
+    import second
+    second.DEBUG = False
+    second.MATCH_GRAMMAR_PHRASES = grammar_phrases
+    
+    tallies = {}
+    for fen in fens:
+        position = chess.Board(fen)
+        for move in second.move_index(position).moves:
+            for template, phrase in second.spoken_move_phrases(position, move).items():
+                moves, _ = second.command_candidates(second.normalize_utterance(phrase), position)
+                tally = tallies.setdefault(template, [0, 0, 0])
+                tally[0] += 1
+                if len(moves) > 1:
+                    tally[1] += 1
+                if not moves or moves[0] != move:
+                    tally[2] += 1
+    return len(fens), tallies
+
+def add_tallies(totals, tallies):
+    for template, tally in tallies.items():
+        total = totals.setdefault(template, [0, 0, 0])
+        for i, value in enumerate(tally):
+            total[i] += value
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pgn', help='PGN file to read')
+    parser.add_argument('--max-games', type=int, help='stop after this many games')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--grammar-phrases', action='store_true',
+                        help='resolve the phrases by grammar lookup, as the game does')
+    args = parser.parse_args()
+    
+    totals = {}
+    positions = 0
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        pending = set()
+        for batch in position_batches(args.pgn, args.max_games):
+            pending.add(pool.submit(parse_batch, batch, args.grammar_phrases))
+            if len(pending) < args.workers * 4:
+                continue
+            # Keep a bounded number of batches in flight so memory stays flat
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                count, tallies = future.result()
+                positions += count
+                add_tallies(totals, tallies)
+        for future in concurrent.futures.as_completed(pending):
+            count, tallies = future.result()
+            positions += count
+            add_tallies(totals, tallies)
+    elapsed = time.perf_counter() - start
+    
+    parses = sum(total[0] for total in totals.values())
+    report = {
+        'positions': positions,
+        'parses': parses,
+        'seconds': elapsed,
+        'parses_per_second': parses / elapsed if elapsed else None,
+        'templates': {
+            template: {
+                'phrases': count,
+                'ambiguity_rate': ambiguous / count,
+                'misresolution_rate': wrong / count,
+            }
+            for template, (count, ambiguous, wrong) in sorted(totals.items())
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
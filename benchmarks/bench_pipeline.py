@@ -0,0 +1,112 @@
+"""Headless end-to-end benchmark of the voice command pipeline.
+
+Plays every WAV file (16 kHz, mono, 16-bit) in a directory through the same code
+the game uses: WavFileSource -> AudioRing -> FrameVAD endpointing -> Vosk ->
+filter_repeated_words -> preprocess_speech_input -> parse_command. Labels come
+from labels.json in the same directory:
+
+    {"e4.wav": {"fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", "move": "e2e4"}}
+
+The report is JSON: per-stage p50/p95/p99 latency in milliseconds, real-time
+factor of the decoder and move accuracy. The first half second of each file is
+used to calibrate the noise floor, so recordings should start with a little silence.
+
+    python -m benchmarks.bench_pipeline --model path/to/vosk-model samples/ > report.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import chess
+import vosk
+
+import second
+
+STAGES = ['vad', 'decode', 'filter', 'preprocess', 'parse', 'end_of_audio_to_move']
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda fraction: values[min(len(values) - 1, int(len(values) * fraction))] * 1000.0
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+def run_utterance(model, path, label):
+    position = chess.Board(label.get('fen', chess.STARTING_FEN))
+    source = second.WavFileSource(path)
+    ring = second.AudioRing(second.SAMPLE_RATE * 2)
+    vad = second.FrameVAD()
+    vad.calibrate(source.samples[:second.SAMPLE_RATE // 2])
+    if second.USE_GRAMMAR:
+        rec = vosk.KaldiRecognizer(model, second.SAMPLE_RATE, second.move_grammar(position))
+    else:
+        rec = vosk.KaldiRecognizer(model, second.SAMPLE_RATE)
+    rec.SetWords(True)
+    rec.SetMaxAlternatives(second.MAX_ALTERNATIVES)
+    
+    stats = {}
+    source.start(ring)
+    try:
+        text = second.listen_for_command(rec, vad, ring, position, stats) or ""
+    finally:
+        source.stop()
+    
+    stage_start = time.perf_counter()
+    filtered = second.filter_repeated_words(text)
+    stats['filter'] = time.perf_counter() - stage_start
+    stage_start = time.perf_counter()
+    processed = second.preprocess_speech_input(filtered)
+    stats['preprocess'] = time.perf_counter() - stage_start
+    stage_start = time.perf_counter()
+    move = second.parse_command(processed, position) if processed else None
+    stats['parse'] = time.perf_counter() - stage_start
+    # Negative when a stable partial committed the move before the recording ended
+    stats['end_of_audio_to_move'] = time.perf_counter() - (source.start_time + source.duration)
+    
+    return text, move, source.duration, stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('samples', help='directory of labelled WAV files')
+    parser.add_argument('--model', default=os.environ.get('VOSK_MODEL_PATH'), help='Vosk model directory')
+    args = parser.parse_args()
+    
+    second.DEBUG = False
+    vosk.SetLogLevel(-1)
+    model = vosk.Model(args.model)
+    with open(os.path.join(args.samples, 'labels.json')) as f:
+        labels = json.load(f)
+    
+    timings = {stage: [] for stage in STAGES}
+    audio_seconds = decode_seconds = 0.0
+    correct = 0
+    utterances = []
+    for name in sorted(labels):
+        # Status lines from the listener go to stderr so stdout stays valid JSON
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        try:
+            text, move, duration, stats = run_utterance(model, os.path.join(args.samples, name), labels[name])
+        finally:
+            sys.stdout = stdout
+        for stage in STAGES:
+            if stage in stats:
+                timings[stage].append(stats[stage])
+        audio_seconds += duration
+        decode_seconds += stats['decode']
+        expected = labels[name].get('move')
+        correct += bool(move and move.uci() == expected)
+        utterances.append({'file': name, 'heard': text, 'move': move.uci() if move else None, 'expected': expected})
+    
+    report = {
+        'utterances': len(utterances),
+        'accuracy': correct / len(utterances) if utterances else None,
+        'real_time_factor': decode_seconds / audio_seconds if audio_seconds else None,
+        'stages_ms': {stage: percentiles(values) for stage, values in timings.items()},
+        'results': utterances,
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Load test for the multi-session voice chess server.
+
+Opens a growing number of concurrent sessions against a running server.py and has
+each one stream labelled WAV recordings (16 kHz, mono, 16-bit, with the same
+labels.json as the other speech benchmarks) at real-time pace. For every session
+count it reports move accuracy, p50/p99 latency from the end of the audio to the
+recognized move, and the server's resident memory. The sessions per machine is
+the largest count whose p99 stays within the target:
+
+    python server.py --model path/to/vosk-model &
+    python -m benchmarks.bench_server samples/ --sessions 1,2,4,8,16,32
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import wave
+
+from server import read_message, write_message
+
+def load_samples(directory):
+    with open(os.path.join(directory, 'labels.json')) as f:
+        labels = json.load(f)
+    samples = []
+    for name, label in sorted(labels.items()):
+        with wave.open(os.path.join(directory, name), 'rb') as wav:
+            if wav.getframerate() != 16000 or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                raise SystemExit(f"{name}: expected 16 kHz mono 16-bit audio")
+            samples.append((wav.readframes(wav.getnframes()), label))
+    return samples
+
+async def request(reader, writer, kind, payload=b''):
+    write_message(writer, kind, payload)
+    await writer.drain()
+    _, reply = await read_message(reader)
+    return json.loads(reply)
+
+async def run_session(args, samples, offset, latencies, results):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    chunk_bytes = int(16000 * args.chunk_ms / 1000) * 2
+    try:
+        for i in range(args.utterances):
+            audio, label = samples[(offset + i) % len(samples)]
+            await request(reader, writer, b'P', label.get('fen', '').encode('ascii'))
+            write_message(writer, b'S')
+            for start in range(0, len(audio), chunk_bytes):
+                write_message(writer, b'A', audio[start:start + chunk_bytes])
+                await writer.drain()
+                # Pace the audio like a microphone would deliver it
+                await asyncio.sleep(args.chunk_ms / 1000)
+            end_of_audio = time.perf_counter()
+            reply = await request(reader, writer, b'E')
+            latencies.append(time.perf_counter() - end_of_audio)
+            results.append(reply.get('move') == label['move'])
+    finally:
+        writer.close()
+
+async def run_step(args, samples, sessions):
+    latencies, results = [], []
+    await asyncio.gather(*(run_session(args, samples, offset, latencies, results) for offset in range(sessions)))
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    info = await request(reader, writer, b'I')
+    writer.close()
+    latencies.sort()
+    pick = lambda fraction: latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000.0
+    return {
+        'sessions': sessions,
+        'utterances': len(latencies),
+        'accuracy': sum(results) / len(results),
+        'p50_ms': pick(0.50),
+        'p99_ms': pick(0.99),
+        'server_rss_kb': info.get('rss_kb'),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('samples', help='directory of labelled WAV files')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--sessions', default='1,2,4,8,16', help='comma-separated concurrent session counts')
+    parser.add_argument('--utterances', type=int, default=5, help='utterances per session at each step')
+    parser.add_argument('--chunk-ms', type=int, default=100, help='audio per message in milliseconds')
+    parser.add_argument('--target-p99-ms', type=float, default=500.0, help='p99 latency a session count must stay within')
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    steps = []
+    print(f"{'sessions':>8}{'accuracy':>10}{'p50 ms':>9}{'p99 ms':>9}{'server RSS MB':>15}")
+    for sessions in (int(count) for count in args.sessions.split(',')):
+        step = asyncio.run(run_step(args, samples, sessions))
+        steps.append(step)
+        rss = f"{step['server_rss_kb'] / 1024:.0f}" if step['server_rss_kb'] else '?'
+        print(f"{sessions:>8}{step['accuracy']:>10.1%}{step['p50_ms']:>9.1f}{step['p99_ms']:>9.1f}{rss:>15}")
+
+    within = [step['sessions'] for step in steps if step['p99_ms'] <= args.target_p99_ms]
+    print(f"Sessions per machine at p99 <= {args.target_p99_ms:.0f} ms: {max(within) if within else 0}")
+    if len(steps) > 1 and steps[0]['server_rss_kb'] and steps[-1]['server_rss_kb']:
+        added = steps[-1]['sessions'] - steps[0]['sessions']
+        per_session = (steps[-1]['server_rss_kb'] - steps[0]['server_rss_kb']) / max(1, added)
+        print(f"Server memory per added session: {per_session / 1024:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Syzygy tablebase probe latency benchmark.
+
+Generates random legal endgame positions for the material the tables in a
+directory cover and times WDL and DTZ probes: a first pass, which memory-maps
+each table as it is needed, a repeated pass, and lookups served by the game's
+LRU of probe results:
+
+    python -m benchmarks.bench_syzygy path/to/syzygy
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+import chess
+import chess.syzygy
+
+from benchmarks.bench_normalize import load_second
+
+PIECE_SYMBOLS = {'K': chess.KING, 'Q': chess.QUEEN, 'R': chess.ROOK, 'B': chess.BISHOP, 'N': chess.KNIGHT, 'P': chess.PAWN}
+
+def random_position(material, rng):
+    """A random legal position with the material of a table name such as 'KRvKP', or None"""
+    white, black = material.split('v')
+    position = chess.Board(None)
+    squares = rng.sample(chess.SQUARES, len(white) + len(black))
+    for color, pieces in ((chess.WHITE, white), (chess.BLACK, black)):
+        for symbol in pieces:
+            square = squares.pop()
+            if symbol == 'P' and chess.square_rank(square) in (0, 7):
+                return None
+            position.set_piece_at(square, chess.Piece(PIECE_SYMBOLS[symbol], color))
+    position.turn = rng.choice(chess.COLORS)
+    return position if position.is_valid() else None
+
+def generate_positions(tables, count, seed):
+    rng = random.Random(seed)
+    materials = sorted(tables.wdl)
+    positions = []
+    while len(positions) < count:
+        position = random_position(rng.choice(materials), rng)
+        if position is not None:
+            positions.append(position)
+    return positions
+
+def summary(name, timings):
+    timings = sorted(timings)
+    print(f"{name:<20} mean {statistics.fmean(timings):8.1f} us  p50 {timings[len(timings) // 2]:8.1f} us  "
+          f"p95 {timings[int(len(timings) * 0.95)]:8.1f} us  ({len(timings)} probes)")
+
+def main():
+    default_source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'second.py')
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', nargs='?', default=os.environ.get('VOICE_CHESS_SYZYGY'), help='Syzygy table directory')
+    parser.add_argument('--positions', type=int, default=2000, help='endgame positions to generate')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--source', default=default_source, help='second.py whose probe cache is timed')
+    args = parser.parse_args()
+    if not args.directory:
+        parser.error('pass a Syzygy directory or set VOICE_CHESS_SYZYGY')
+
+    start = time.perf_counter()
+    tables = chess.syzygy.open_tablebase(args.directory)
+    print(f"Opened {len(tables.wdl)} WDL and {len(tables.dtz)} DTZ tables in {(time.perf_counter() - start) * 1000:.1f} ms")
+    if not tables.wdl:
+        return
+    positions = generate_positions(tables, args.positions, args.seed)
+
+    def probe_all(record):
+        timings = []
+        for position in positions:
+            start = time.perf_counter_ns()
+            try:
+                result = (tables.probe_wdl(position), tables.probe_dtz(position))
+            except KeyError:  # A table needed after a capture or promotion is missing
+                result = ()
+            timings.append((time.perf_counter_ns() - start) / 1000.0)
+            if record is not None:
+                record(position, result)
+        return timings
+
+    first = probe_all(None)
+    summary('first pass', first)
+    summary('repeated', probe_all(None))
+
+    second = load_second(args.source)
+    cache = second.LRUCache(len(positions))
+    probe_all(lambda position, result: cache.put(second.position_key(position), result))
+    cached = []
+    for position in positions:
+        start = time.perf_counter_ns()
+        cache.get(second.position_key(position))
+        cached.append((time.perf_counter_ns() - start) / 1000.0)
+    summary('LRU cache hit', cached)
+    tables.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,503 @@
+"""Computer opponent for Offline Voice Chess.
+
+Alpha-beta search with iterative deepening, a Zobrist-keyed transposition table and
+move ordering over python-chess boards. EngineProcess runs the search in a worker
+process so the game window and the speech listener never wait on it.
+"""
+import multiprocessing
+import queue
+import random
+import time
+
+import chess
+import chess.polyglot
+import chess.syzygy
+
+MATE_SCORE = 100000
+INFINITY = MATE_SCORE + 1
+# Transposition table entries kept before the table is cleared
+TABLE_SIZE = 1 << 20
+# How many nodes are searched between checks of the clock and the stop flag
+CHECK_INTERVAL = 2048
+
+PIECE_VALUES = {
+    chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330,
+    chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0,
+}
+
+# Piece-square tables from White's side, written with rank 8 on top
+PIECE_SQUARE_TABLES = {
+    chess.PAWN: [
+         0,  0,  0,  0,  0,  0,  0,  0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+         5,  5, 10, 25, 25, 10,  5,  5,
+         0,  0,  0, 20, 20,  0,  0,  0,
+         5, -5,-10,  0,  0,-10, -5,  5,
+         5, 10, 10,-20,-20, 10, 10,  5,
+         0,  0,  0,  0,  0,  0,  0,  0,
+    ],
+    chess.KNIGHT: [
+        -50,-40,-30,-30,-30,-30,-40,-50,
+        -40,-20,  0,  0,  0,  0,-20,-40,
+        -30,  0, 10, 15, 15, 10,  0,-30,
+        -30,  5, 15, 20, 20, 15,  5,-30,
+        -30,  0, 15, 20, 20, 15,  0,-30,
+        -30,  5, 10, 15, 15, 10,  5,-30,
+        -40,-20,  0,  5,  5,  0,-20,-40,
+        -50,-40,-30,-30,-30,-30,-40,-50,
+    ],
+    chess.BISHOP: [
+        -20,-10,-10,-10,-10,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5, 10, 10,  5,  0,-10,
+        -10,  5,  5, 10, 10,  5,  5,-10,
+        -10,  0, 10, 10, 10, 10,  0,-10,
+        -10, 10, 10, 10, 10, 10, 10,-10,
+        -10,  5,  0,  0,  0,  0,  5,-10,
+        -20,-10,-10,-10,-10,-10,-10,-20,
+    ],
+    chess.ROOK: [
+         0,  0,  0,  0,  0,  0,  0,  0,
+         5, 10, 10, 10, 10, 10, 10,  5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+         0,  0,  0,  5,  5,  0,  0,  0,
+    ],
+    chess.QUEEN: [
+        -20,-10,-10, -5, -5,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5,  5,  5,  5,  0,-10,
+         -5,  0,  5,  5,  5,  5,  0, -5,
+          0,  0,  5,  5,  5,  5,  0, -5,
+        -10,  5,  5,  5,  5,  5,  0,-10,
+        -10,  0,  5,  0,  0,  0,  0,-10,
+        -20,-10,-10, -5, -5,-10,-10,-20,
+    ],
+    chess.KING: [
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -20,-30,-30,-40,-40,-30,-30,-20,
+        -10,-20,-20,-20,-20,-20,-20,-10,
+         20, 20,  0,  0,  0,  0, 20, 20,
+         20, 30, 10,  0,  0, 10, 30, 20,
+    ],
+}
+
+def build_square_values():
+    """Material plus placement for every (color, piece type), indexed by square a1 = 0"""
+    values = {}
+    for piece_type, table in PIECE_SQUARE_TABLES.items():
+        for square in chess.SQUARES:
+            # The tables list rank 8 first, so White's a1 is entry 56
+            white_index = (7 - chess.square_rank(square)) * 8 + chess.square_file(square)
+            black_index = chess.square_rank(square) * 8 + chess.square_file(square)
+            values.setdefault((chess.WHITE, piece_type), [0] * 64)[square] = PIECE_VALUES[piece_type] + table[white_index]
+            values.setdefault((chess.BLACK, piece_type), [0] * 64)[square] = PIECE_VALUES[piece_type] + table[black_index]
+    return values
+
+SQUARE_VALUES = build_square_values()
+
+# Zobrist keys; a fixed seed keeps hashes stable between the game and the worker process
+zobrist_random = random.Random(0x5eed)
+PIECE_KEYS = {(color, piece_type): [zobrist_random.getrandbits(64) for _ in chess.SQUARES]
+              for color in chess.COLORS for piece_type in chess.PIECE_TYPES}
+SIDE_KEY = zobrist_random.getrandbits(64)
+CASTLING_KEYS = {corner: zobrist_random.getrandbits(64) for corner in (chess.A1, chess.H1, chess.A8, chess.H8)}
+EN_PASSANT_KEYS = [zobrist_random.getrandbits(64) for _ in chess.FILE_NAMES]
+
+def zobrist_hash(position):
+    """Hash of a position from scratch: pieces, side to move, castling rights and en passant file"""
+    key = 0
+    for square, piece in position.piece_map().items():
+        key ^= PIECE_KEYS[piece.color, piece.piece_type][square]
+    if position.turn == chess.BLACK:
+        key ^= SIDE_KEY
+    for corner, corner_key in CASTLING_KEYS.items():
+        if position.castling_rights & chess.BB_SQUARES[corner]:
+            key ^= corner_key
+    if position.ep_square is not None:
+        key ^= EN_PASSANT_KEYS[chess.square_file(position.ep_square)]
+    return key
+
+def push_hashed(position, key, move):
+    """Push move onto position and return the updated hash of the new position"""
+    piece_type = position.piece_type_at(move.from_square)
+    color = position.turn
+    key ^= SIDE_KEY
+    key ^= PIECE_KEYS[color, piece_type][move.from_square]
+    key ^= PIECE_KEYS[color, move.promotion or piece_type][move.to_square]
+    if position.is_en_passant(move):
+        captured_square = move.to_square - 8 if color == chess.WHITE else move.to_square + 8
+        key ^= PIECE_KEYS[not color, chess.PAWN][captured_square]
+    elif position.is_castling(move):
+        rank_start = move.to_square & ~7
+        if move.to_square > move.from_square:
+            rook_from, rook_to = rank_start + 7, rank_start + 5
+        else:
+            rook_from, rook_to = rank_start, rank_start + 3
+        key ^= PIECE_KEYS[color, chess.ROOK][rook_from] ^ PIECE_KEYS[color, chess.ROOK][rook_to]
+    else:
+        captured = position.piece_type_at(move.to_square)
+        if captured:
+            key ^= PIECE_KEYS[not color, captured][move.to_square]
+
+    old_rights, old_ep = position.castling_rights, position.ep_square
+    position.push(move)
+    changed = old_rights ^ position.castling_rights
+    if changed:
+        for corner, corner_key in CASTLING_KEYS.items():
+            if changed & chess.BB_SQUARES[corner]:
+                key ^= corner_key
+    if old_ep is not None:
+        key ^= EN_PASSANT_KEYS[chess.square_file(old_ep)]
+    if position.ep_square is not None:
+        key ^= EN_PASSANT_KEYS[chess.square_file(position.ep_square)]
+    return key
+
+def evaluate(position):
+    """Static score in centipawns from the side to move's point of view"""
+    score = 0
+    for (color, piece_type), values in SQUARE_VALUES.items():
+        mask = position.pieces_mask(piece_type, color)
+        if mask:
+            total = sum(values[square] for square in chess.scan_forward(mask))
+            score += total if color == chess.WHITE else -total
+    return score if position.turn == chess.WHITE else -score
+
+class SearchStopped(Exception):
+    """Raised inside the search when the time budget runs out or the search is cancelled"""
+
+# Transposition table bound types
+EXACT, LOWER, UPPER = 0, 1, 2
+# Scores at least this far from zero are mates
+MATE_BOUND = MATE_SCORE - 1000
+
+def score_to_table(score, ply):
+    """Mate scores count plies from the root; the table counts them from the node, so an entry
+    stays right when the position is reached again at another ply"""
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+def score_from_table(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+class Search:
+    """Iterative deepening alpha-beta search; the transposition table is kept between moves"""
+
+    def __init__(self):
+        self.table = {}
+        self.killers = {}
+        self.nodes = 0
+        self.deadline = None
+        self.should_stop = None
+        self.history_keys = set()
+
+    def run(self, position, time_budget=None, max_depth=64, should_stop=None):
+        """Search position and return a dict with the best move, depth, score, nodes and seconds.
+
+        Stops after max_depth plies, when time_budget seconds have passed or when should_stop()
+        returns true, and returns the result of the deepest iteration that finished.
+        """
+        position = position.copy()
+        start = time.perf_counter()
+        self.deadline = start + time_budget if time_budget else None
+        self.should_stop = should_stop
+        self.nodes = 0
+        self.killers = {}
+        if len(self.table) > TABLE_SIZE:
+            self.table.clear()
+
+        # Positions already seen in the game count as draws if the search walks back into them
+        self.history_keys = set()
+        replay = position.root()
+        key = zobrist_hash(replay)
+        for move in position.move_stack:
+            self.history_keys.add(key)
+            key = push_hashed(replay, key, move)
+
+        moves = list(position.legal_moves)
+        result = {'move': moves[0] if moves else None, 'depth': 0, 'score': 0, 'nodes': 0, 'seconds': 0.0, 'source': 'search'}
+        if len(moves) > 1:
+            for depth in range(1, max_depth + 1):
+                try:
+                    score, move = self.root_search(position, key, depth)
+                except SearchStopped:
+                    break
+                result.update(move=move, depth=depth, score=score)
+                if abs(score) >= MATE_SCORE - max_depth:
+                    break
+        result['nodes'] = self.nodes
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    def check_stop(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchStopped()
+        if self.should_stop is not None and self.should_stop():
+            raise SearchStopped()
+
+    def order_moves(self, position, moves, best_move, ply):
+        """Transposition table move first, then captures by most valuable victim and least valuable attacker, then killers"""
+        killers = self.killers.get(ply, ())
+
+        def priority(move):
+            if move == best_move:
+                return -1000000
+            if position.is_capture(move):
+                victim = position.piece_type_at(move.to_square) or chess.PAWN
+                return -100000 - PIECE_VALUES[victim] * 10 + PIECE_VALUES[position.piece_type_at(move.from_square)] // 10
+            if move.promotion:
+                return -90000 - PIECE_VALUES[move.promotion]
+            if move in killers:
+                return -50000
+            return 0
+
+        moves.sort(key=priority)
+        return moves
+
+    def root_search(self, position, key, depth):
+        entry = self.table.get(key)
+        moves = self.order_moves(position, list(position.legal_moves), entry[3] if entry else None, 0)
+        alpha, best_move = -INFINITY, moves[0]
+        for move in moves:
+            child_key = push_hashed(position, key, move)
+            try:
+                score = -self.alpha_beta(position, child_key, depth - 1, -INFINITY, -alpha, 1)
+            finally:
+                position.pop()
+            if score > alpha:
+                alpha, best_move = score, move
+        self.table[key] = (depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def alpha_beta(self, position, key, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0:
+            self.check_stop()
+
+        if key in self.history_keys or position.halfmove_clock >= 100:
+            return 0
+        if depth <= 0:
+            return self.quiescence(position, alpha, beta)
+
+        original_alpha = alpha
+        entry = self.table.get(key)
+        best_move = None
+        if entry:
+            entry_depth, entry_score, bound, best_move = entry
+            entry_score = score_from_table(entry_score, ply)
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return entry_score
+                if bound == LOWER:
+                    alpha = max(alpha, entry_score)
+                elif bound == UPPER:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score
+
+        moves = list(position.legal_moves)
+        if not moves:
+            return -(MATE_SCORE - ply) if position.is_check() else 0
+
+        self.history_keys.add(key)
+        best_score = -INFINITY
+        try:
+            for move in self.order_moves(position, moves, best_move, ply):
+                child_key = push_hashed(position, key, move)
+                try:
+                    score = -self.alpha_beta(position, child_key, depth - 1, -beta, -alpha, ply + 1)
+                finally:
+                    position.pop()
+                if score > best_score:
+                    best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    if not position.is_capture(move):
+                        killers = self.killers.setdefault(ply, [])
+                        if move not in killers:
+                            killers.insert(0, move)
+                            del killers[2:]
+                    break
+        finally:
+            self.history_keys.discard(key)
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table[key] = (depth, score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def quiescence(self, position, alpha, beta):
+        """Search captures only, so the static evaluation is never taken in the middle of an exchange"""
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0:
+            self.check_stop()
+
+        stand_pat = evaluate(position)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        captures = self.order_moves(position, list(position.generate_legal_captures()), None, -1)
+        for move in captures:
+            position.push(move)
+            try:
+                score = -self.quiescence(position, -beta, -alpha)
+            finally:
+                position.pop()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+def book_move(book, position):
+    """Result dict for a weighted random book move, or None once the game has left the book"""
+    if book is None:
+        return None
+    try:
+        entry = book.weighted_choice(position)
+    except IndexError:
+        return None
+    if not position.is_legal(entry.move):
+        return None
+    return {'move': entry.move, 'depth': 0, 'score': 0, 'nodes': 0, 'seconds': 0.0, 'source': 'book'}
+
+def tablebase_max_pieces(tablebase):
+    """Most pieces of any WDL table found, e.g. 5 for a directory of 3-4-5 piece tables"""
+    return max((len(name) - 1 for name in tablebase.wdl), default=0)
+
+def tablebase_move(tablebase, position, max_pieces):
+    """Result dict for the tablebase-perfect move, or None when the position is out of range or a table is missing.
+
+    Moves are ranked by the opponent's WDL after the move, then by DTZ: the quickest
+    zeroing path while winning and the longest while losing.
+    """
+    if tablebase is None or chess.popcount(position.occupied) > max_pieces or position.castling_rights:
+        return None
+    best, best_rank = None, None
+    try:
+        for move in position.legal_moves:
+            position.push(move)
+            try:
+                if position.is_checkmate():
+                    rank = (-2, -INFINITY)
+                else:
+                    rank = (tablebase.probe_wdl(position), -tablebase.probe_dtz(position))
+            finally:
+                position.pop()
+            if best_rank is None or rank < best_rank:
+                best, best_rank = move, rank
+    except KeyError:  # MissingTableError
+        return None
+    if best is None:
+        return None
+    return {'move': best, 'depth': 0, 'score': -best_rank[0], 'nodes': 0, 'seconds': 0.0, 'source': 'tablebase'}
+
+def engine_worker(requests, replies, cancelled, book_path=None, tablebase_path=None):
+    """Worker process loop: answer (request id, board, time budget, max depth) requests until None arrives.
+
+    Requests with an id up to cancelled.value are abandoned. Book moves are played while there
+    are any, and tablebase moves once few enough pieces are left.
+    """
+    search = Search()
+    book = chess.polyglot.open_reader(book_path) if book_path else None
+    tablebase = chess.syzygy.open_tablebase(tablebase_path) if tablebase_path else None
+    max_pieces = tablebase_max_pieces(tablebase) if tablebase else 0
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, position, time_budget, max_depth = request
+        if cancelled.value >= request_id:
+            continue
+        result = (book_move(book, position) or tablebase_move(tablebase, position, max_pieces)
+                  or search.run(position, time_budget, max_depth, lambda: cancelled.value >= request_id))
+        replies.put((request_id, result))
+
+class EngineProcess:
+    """Runs Search in a separate process; think() returns at once.
+
+    The reply arrives on the replies queue: pass it to accept(), or call poll() to take it off
+    the queue without waiting.
+
+    With a Polyglot book_path the worker plays from the book before it starts searching, and
+    with a Syzygy tablebase_path it plays perfect moves in endgames the tables cover.
+    """
+
+    def __init__(self, book_path=None, tablebase_path=None):
+        # Spawn rather than fork: the game process already runs pygame and the audio threads
+        context = multiprocessing.get_context('spawn')
+        self.requests = context.Queue()
+        self.replies = context.Queue()
+        self.cancelled = context.Value('q', 0, lock=False)
+        self.process = context.Process(target=engine_worker, args=(self.requests, self.replies, self.cancelled, book_path, tablebase_path),
+                                       daemon=True)
+        self.request_id = 0
+        self.pending = None
+
+    def start(self):
+        self.process.start()
+
+    def think(self, position, time_budget, max_depth=64):
+        """Start searching position; any search still running is cancelled first"""
+        if self.pending is not None:
+            self.cancel()
+        self.request_id += 1
+        self.pending = self.request_id
+        self.requests.put((self.request_id, position.copy(), time_budget, max_depth))
+        return self.request_id
+
+    def poll(self):
+        """Result dict of the current request if it has finished, else None; stale replies are dropped"""
+        while self.pending is not None:
+            try:
+                reply = self.replies.get_nowait()
+            except queue.Empty:
+                return None
+            result = self.accept(reply)
+            if result is not None:
+                return result
+        return None
+
+    def accept(self, reply):
+        """Result dict of a reply taken off replies if it answers the current request, else None"""
+        request_id, result = reply
+        if request_id != self.pending:
+            return None
+        self.pending = None
+        return result
+
+    @property
+    def thinking(self):
+        return self.pending is not None
+
+    def cancel(self):
+        """Stop the current search; its reply will be ignored"""
+        self.cancelled.value = self.request_id
+        self.pending = None
+
+    def close(self, timeout=1.0):
+        self.cancel()
+        if self.process.is_alive():
+            self.requests.put(None)
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
@@ -0,0 +1,153 @@
+"""Append-only game journal for Offline Voice Chess.
+
+The file starts with a header holding the starting FEN, followed by one fixed-size
+record per confirmed move or undo. Saving a move is a single small append; records
+are fsynced in batches. Resuming replays the records onto the starting position.
+"""
+import os
+import struct
+import time
+
+import chess
+
+MAGIC = b'VCJ1'
+# Magic and FEN length; the FEN itself follows
+HEADER = struct.Struct('>4sH')
+# Operation, packed move and a check byte that exposes torn or garbled records
+RECORD = struct.Struct('>BHB')
+MOVE, UNDO = 1, 2
+
+def pack_move(move):
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+def unpack_move(packed):
+    return chess.Move(packed & 0x3f, (packed >> 6) & 0x3f, (packed >> 12) or None)
+
+def check_byte(operation, packed):
+    return operation ^ (packed >> 8) ^ (packed & 0xff) ^ 0x5a
+
+class Journal:
+    """Journal file of one game; fsyncs after sync_every records or sync_interval seconds"""
+
+    def __init__(self, path, sync_every=8, sync_interval=1.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.fd = None
+        self.unsynced = 0
+        # When the oldest record not yet fsynced was written
+        self.first_unsynced = None
+
+    def start(self, position):
+        """Begin a new game at position, replacing any previous journal atomically"""
+        self.close()
+        fen = position.root().fen().encode('ascii')
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(fen)) + fen)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.open_for_append()
+        # Replay the moves already on the board so the journal describes the whole game
+        for move in position.move_stack:
+            self.append(MOVE, move)
+        self.sync()
+
+    def resume(self, position):
+        """Replay the journal onto position; returns the redo moves, or None when there is no usable journal.
+
+        A torn or invalid record ends the replay and is cut off, so the next append starts
+        from the last good record. Without a usable journal position is left alone.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < HEADER.size:
+            return None
+        magic, fen_length = HEADER.unpack_from(data)
+        offset = HEADER.size + fen_length
+        if magic != MAGIC or len(data) < offset:
+            return None
+        try:
+            position.set_fen(data[HEADER.size:offset].decode('ascii'))
+        except ValueError:
+            return None
+
+        redo = []
+        while offset + RECORD.size <= len(data):
+            operation, packed, check = RECORD.unpack_from(data, offset)
+            if check != check_byte(operation, packed):
+                break
+            if operation == MOVE:
+                move = unpack_move(packed)
+                if not position.is_legal(move):
+                    break
+                apply_move(position, redo, move)
+            elif operation == UNDO and position.move_stack:
+                redo.append(position.pop())
+            else:
+                break
+            offset += RECORD.size
+
+        if offset < len(data):
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+        self.close()
+        self.open_for_append()
+        return redo
+
+    def open_for_append(self):
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | getattr(os, 'O_BINARY', 0))
+
+    def append(self, operation, move=None):
+        packed = pack_move(move) if move else 0
+        os.write(self.fd, RECORD.pack(operation, packed, check_byte(operation, packed)))
+        if not self.unsynced:
+            self.first_unsynced = time.monotonic()
+        self.unsynced += 1
+        self.maybe_sync()
+
+    def record_move(self, move):
+        if self.fd is not None:
+            self.append(MOVE, move)
+
+    def record_undo(self):
+        if self.fd is not None:
+            self.append(UNDO)
+
+    def sync_due_in(self):
+        """Seconds until the unsynced records are due for an fsync, or None when there are none"""
+        if not self.unsynced:
+            return None
+        if self.unsynced >= self.sync_every:
+            return 0.0
+        return max(0.0, self.first_unsynced + self.sync_interval - time.monotonic())
+
+    def maybe_sync(self):
+        """fsync once sync_every records have built up or the oldest has waited sync_interval;
+        cheap enough to call every frame"""
+        if self.sync_due_in() == 0.0:
+            self.sync()
+
+    def sync(self):
+        if self.fd is not None and self.unsynced:
+            os.fsync(self.fd)
+        self.unsynced = 0
+        self.first_unsynced = None
+
+    def close(self):
+        if self.fd is not None:
+            self.sync()
+            os.close(self.fd)
+            self.fd = None
+
+def apply_move(position, redo, move):
+    """Push move, keeping the redo stack only when the move is the one it would redo"""
+    if redo and redo[-1] == move:
+        redo.pop()
+    else:
+        redo.clear()
+    position.push(move)
@@ -1,23 +1,35 @@
+import time
+STARTUP_START = time.perf_counter()
 import pygame
 import chess
+import chess.pgn
+import chess.polyglot
+import chess.syzygy
 import os
 import sys
 import re
-import time
 import threading
+import multiprocessing
 import queue
 import numpy as np  # Moved to global import for clarity
 import vosk
-import pyaudio
 import json
+import wave
+import engine
+import journal
+import tracing
+try:
+    import pyaudio
+except ImportError:  # Only needed for microphone capture; WAV sources work without it
+    pyaudio = None
+from collections import OrderedDict
 
-# Initialize Pygame
-pygame.init()
+# Seconds spent in each startup phase, reported once the speech model is warm
+startup_timings = {'imports': time.perf_counter() - STARTUP_START}
 
-# Set up the display
+# Display size; the window itself is opened in main() so the parser can be imported headless
 WIDTH, HEIGHT = 600, 650
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption('Offline Voice Chess')
+screen = None
 
 # Initialize the chess board
 board = chess.Board()
@@ -30,14 +42,33 @@ BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 BLUE = (0, 0, 255)
 
-# Message queue for communication between threads
-speech_queue = queue.Queue()
-status_message = "Press SPACE to speak a move"
-listening = False
-recognized_text = ""
-pending_move = None
-confirming_move = False
-audio_level = 0
+class GameState:
+    """What the window shows about listening, confirming and loading, in one place.
+    
+    The main loop owns it: helper threads and processes post pygame events instead of
+    touching it. Changes to several fields go through update() so a frame never sees half
+    of them; single fields are assigned directly.
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.status_message = "Press SPACE to speak a move"
+        self.listening = False
+        self.listen_start_time = 0
+        self.recognized_text = ""
+        self.audio_level = 0.0
+        self.pending_move = None
+        self.confirming_move = False
+        # Speech model loading state: 'loading', 'ready' or 'failed'
+        self.model_state = 'loading'
+    
+    def update(self, **changes):
+        with self.lock:
+            for name, value in changes.items():
+                setattr(self, name, value)
+
+game_state = GameState()
+
 # Add this to your global variables section (somewhere near the top with other global definitions)
 piece_map = {
     'pawn': '',    # Pawns have no symbol in algebraic notation
@@ -47,164 +78,474 @@ piece_map = {
     'queen': 'Q',
     'king': 'K'
 }
-# Debug mode
-DEBUG = True
+# Console log level: 'error', 'warning', 'info', 'debug' or 'trace' (which adds every legal move
+# when a command can't be parsed); VOICE_CHESS_LOG overrides it. DEBUG and TRACE guard the
+# hot-path records, so a disabled level costs nothing
+LOG_LEVEL = os.environ.get('VOICE_CHESS_LOG', 'info')
+tracing.set_level(LOG_LEVEL)
+DEBUG = tracing.enabled('debug')
+TRACE = tracing.enabled('trace')
+# Stage timestamps of every utterance; cheap enough to leave on
+TRACING = True
 # Add these to your global variables
 MAX_LISTEN_TIME = 5.0  # seconds
-SILENCE_THRESHOLD = 100  # Adjust based on testing
-SILENCE_DURATION = 1.0  # seconds
+# How long past MAX_LISTEN_TIME the UI waits for the speech process before giving up on it
+LISTEN_GRACE_TIME = 2.0  # seconds
+# Voice activity detection: speech is this many dB above the tracked noise floor
+VAD_MARGIN_DB = 9.0
+# Non-speech after speech before an utterance is finalized
+ENDPOINT_HANGOVER = 0.4  # seconds
+# A partial result that names exactly one legal move for this long is taken as final
+PARTIAL_STABLE_SECONDS = 0.3
+# Recognizer alternatives rescored against the legal moves
+MAX_ALTERNATIVES = 10
+# Restrict the recognizer to phrases for the current legal moves (needs a model with runtime graph support)
+USE_GRAMMAR = True
+# Resolve the grammar's own phrases by lookup before the parsing heuristics
+MATCH_GRAMMAR_PHRASES = True
+# Side the computer plays (chess.WHITE or chess.BLACK), or None to enter both sides by voice
+AI_COLOR = chess.BLACK
+# Thinking time per computer move and the deepest it searches
+AI_TIME_BUDGET = 2.0  # seconds
+AI_MAX_DEPTH = 32
+# Optional JSON config next to this file, e.g. {"model_path": "path/to/vosk-model-en-us-0.22"}
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'voice_chess.json')
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vosk-model-en-us-0.22')
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin')
+DEFAULT_TABLEBASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'syzygy')
+# Every confirmed move is appended here, and the game resumes from it on the next start
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'voice_chess.journal')
+PGN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'voice_chess.pgn')
+# Latency traces of the session, written at exit
+TRACE_JSON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'voice_chess_trace.json')
+TRACE_CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'voice_chess_trace.csv')
+# Book moves listed next to the game status
+BOOK_SUGGESTIONS = 3
 
-listen_start_time = 0
-last_sound_time = 0
+# Worker process running the computer opponent's search, started in main()
+ai_engine = None
+# Journal of the current game, opened in main(), and moves taken back that can be replayed
+move_journal = None
+redo_stack = []
+# Polyglot opening book reader, opened in main(); None without a book
+opening_book = None
+# Syzygy tablebase, opened in main(); tables are memory-mapped the first time a position needs them
+tablebase = None
+tablebase_max_pieces = 0
 
 
-# Function to draw the chessboard
-def draw_board(last_move=None):
-    square_size = WIDTH // 8
+class LRUCache:
+    """Small bounded mapping that evicts the least recently used entry and counts hits and misses.
+    
+    Safe to share between the threads of one process: the main loop, the relay and
+    speculation threads, and the capture and decoding threads of the speech process.
+    """
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+    
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+    
+    def __len__(self):
+        return len(self.entries)
+
+# Fonts are created once per size; rendered text surfaces are reused by (text, size, color)
+fonts = {}
+text_cache = LRUCache(256)
+
+def get_font(size):
+    font = fonts.get(size)
+    if font is None:
+        font = fonts[size] = pygame.font.Font(None, size)
+    return font
+
+def render_text(text, size, color):
+    key = (text, size, color)
+    surface = text_cache.get(key)
+    if surface is None:
+        surface = get_font(size).render(text, True, color)
+        text_cache.put(key, surface)
+    return surface
+
+# Board squares and coordinate labels, pre-composited once per square size
+board_background = None
+board_labels = None
+
+def build_board_surfaces(square_size):
+    global board_background, board_labels
+    
+    board_background = pygame.Surface((square_size * 8, square_size * 8))
     for row in range(8):
         for col in range(8):
             color = WHITE if (row + col) % 2 == 0 else GREEN
-            if last_move:
-                from_file, from_rank = chess.square_file(last_move.from_square), chess.square_rank(last_move.from_square)
-                to_file, to_rank = chess.square_file(last_move.to_square), chess.square_rank(last_move.to_square)
-                if (col == from_file and 7-row == from_rank) or (col == to_file and 7-row == to_rank):
-                    color = HIGHLIGHT
-            pygame.draw.rect(screen, color, pygame.Rect(col * square_size, row * square_size, square_size, square_size))
-    
-    # Draw coordinate labels
-    font = pygame.font.Font(None, 20)
+            pygame.draw.rect(board_background, color, pygame.Rect(col * square_size, row * square_size, square_size, square_size))
+    
+    board_labels = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
     for i in range(8):
-        file_label = font.render(chr(97 + i).upper(), True, BLACK if i % 2 == 1 else WHITE)
-        screen.blit(file_label, (i * square_size + 5, HEIGHT - 85))
-        rank_label = font.render(str(8 - i), True, BLACK if i % 2 == 0 else WHITE)
-        screen.blit(rank_label, (5, i * square_size + 5))
+        file_label = render_text(chr(97 + i).upper(), 20, BLACK if i % 2 == 1 else WHITE)
+        board_labels.blit(file_label, (i * square_size + 5, HEIGHT - 85))
+        rank_label = render_text(str(8 - i), 20, BLACK if i % 2 == 0 else WHITE)
+        board_labels.blit(rank_label, (5, i * square_size + 5))
+    board_background.blit(board_labels, (0, 0))
+
+# Function to draw the chessboard
+def draw_board(last_move=None, area=None):
+    square_size = WIDTH // 8
+    if board_background is None or board_background.get_width() != square_size * 8:
+        build_board_surfaces(square_size)
+    
+    if area:
+        screen.blit(board_background, area.topleft, area)
+    else:
+        screen.blit(board_background, (0, 0))
+    
+    # Highlighted squares cover the background, so their labels are drawn again on top
+    if last_move:
+        for square in (last_move.from_square, last_move.to_square):
+            highlight_rect = pygame.Rect(chess.square_file(square) * square_size, (7 - chess.square_rank(square)) * square_size,
+                                         square_size, square_size)
+            if area and not highlight_rect.colliderect(area):
+                continue
+            pygame.draw.rect(screen, HIGHLIGHT, highlight_rect)
+            screen.blit(board_labels, highlight_rect.topleft, highlight_rect)
+
+# Piece sprites keyed by symbol, loaded and scaled once per square size
+PIECE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pieces')
+piece_sprites = {}
+piece_sprite_size = 0
+
+def load_piece_sprites(square_size):
+    """Load and scale every piece image once, pre-rendering a glyph for any missing image"""
+    global piece_sprite_size
+    
+    piece_sprites.clear()
+    font = get_font(36)
+    for symbol in 'PNBRQKpnbrqk':
+        color_prefix = 'w' if symbol.isupper() else 'b'
+        path = os.path.join(PIECE_DIR, f'{color_prefix}{symbol.lower()}.png')
+        try:
+            piece_image = pygame.image.load(path).convert_alpha()
+            piece_sprites[symbol] = pygame.transform.smoothscale(piece_image, (square_size, square_size))
+        except (FileNotFoundError, pygame.error):
+            if DEBUG:
+                tracing.log('debug', 'piece image missing', path=path)
+            sprite = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+            color = (200, 0, 0) if symbol.isupper() else (0, 0, 200)
+            pygame.draw.circle(sprite, color, (square_size // 2, square_size // 2), square_size // 3)
+            text = font.render(symbol, True, WHITE)
+            sprite.blit(text, text.get_rect(center=(square_size // 2, square_size // 2)))
+            piece_sprites[symbol] = sprite
+    piece_sprite_size = square_size
 
 # Function to draw the chess pieces
-def draw_pieces():
-    piece_images = {
-        'P': 'white-pawn.png', 'N': 'white-knight.png', 'B': 'white-bishop.png',
-        'R': 'white-rook.png', 'Q': 'white-queen.png', 'K': 'white-king.png',
-        'p': 'black-pawn.png', 'n': 'black-knight.png', 'b': 'black-bishop.png',
-        'r': 'black-rook.png', 'q': 'black-queen.png', 'k': 'black-king.png'
-    }
-    
+def draw_pieces(area=None):
     square_size = WIDTH // 8
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            try:
-                piece_image = pygame.image.load(f'images/{piece_images[piece.symbol()]}')
-                piece_image = pygame.transform.scale(piece_image, (square_size, square_size))
-                x = chess.square_file(square) * square_size
-                y = (7 - chess.square_rank(square)) * square_size
-                screen.blit(piece_image, (x, y))
-            except FileNotFoundError:
-                color = (200, 0, 0) if piece.color else (0, 0, 200)
-                x = chess.square_file(square) * square_size
-                y = (7 - chess.square_rank(square)) * square_size
-                pygame.draw.circle(screen, color, (x + square_size // 2, y + square_size // 2), square_size // 3)
-                font = pygame.font.Font(None, 36)
-                text = font.render(piece.symbol(), True, WHITE)
-                text_rect = text.get_rect(center=(x + square_size // 2, y + square_size // 2))
-                screen.blit(text, text_rect)
-
-# Draw move status text
-    global status_message, recognized_text, pending_move, confirming_move, audio_level
-    
-    pygame.draw.rect(screen, WHITE, pygame.Rect(0, HEIGHT - 50, WIDTH, 50))
-    pygame.draw.line(screen, BLACK, (0, HEIGHT - 50), (WIDTH, HEIGHT - 50))
+    if square_size != piece_sprite_size:
+        load_piece_sprites(square_size)
     
-    font = pygame.font.Font(None, 30)
-    
-    game_status = "White's turn" if board.turn else "Black's turn"
-    if board.is_checkmate():
-        winner = "Black" if board.turn else "White"
-        game_status = f"Checkmate! {winner} wins!"
-    elif board.is_stalemate():
-        game_status = "Stalemate!"
-    elif board.is_check():
-        game_status = "Check!"
-    
-    text_surface = font.render(game_status, True, BLACK)
-    screen.blit(text_surface, (10, HEIGHT - 90))
-    
-    if recognized_text:
-        text_surface = font.render(f"Heard: {recognized_text}", True, BLACK)
-        screen.blit(text_surface, (10, HEIGHT - 50))
-    
-    # In the draw_status function, enhance the listening indicator:
-    if listening:
-        listening_text = f"Listening... ({int(MAX_LISTEN_TIME - (time.time() - listen_start_time))}s)"
-        text_surface = font.render(listening_text, True, RED)
-        screen.blit(text_surface, (10, HEIGHT - 25))
-        
-        # Enhance the audio level visualization
-        bar_max_width = 200
-        bar_width = int(min(audio_level * 2000, bar_max_width))
-        pygame.draw.rect(screen, (0, 200, 0), pygame.Rect(WIDTH - 220, HEIGHT - 25, bar_width, 20))
-        pygame.draw.rect(screen, (200, 200, 200), pygame.Rect(WIDTH - 220 + bar_width, HEIGHT - 25, bar_max_width - bar_width, 20), 1)
-    elif confirming_move and pending_move:
-        if isinstance(pending_move, chess.Move):
-            move_text = board.san(pending_move)
+    for square, piece in board.piece_map().items():
+        x = chess.square_file(square) * square_size
+        y = (7 - chess.square_rank(square)) * square_size
+        if area and not area.colliderect((x, y, square_size, square_size)):
+            continue
+        screen.blit(piece_sprites[piece.symbol()], (x, y))
+
+# Screen regions that the status area draws into; the game status line overlaps the first rank
+STATUS_PANEL_RECT = pygame.Rect(0, HEIGHT - 50, WIDTH, 50)
+GAME_STATUS_RECT = pygame.Rect(0, HEIGHT - 90, WIDTH, 25)
+AUDIO_BAR_RECT = pygame.Rect(WIDTH - 220, HEIGHT - 25, 200, 20)
+
+# Game status and move SAN are worked out once per position and then read back by position key
+position_status_cache = LRUCache(512)
+san_cache = LRUCache(512)
+
+def position_key(position=None):
+    """Cheap hashable key of a position: piece placement, side to move, castling rights and en passant square.
+    
+    Built from the public bitboards, so it costs a couple of microseconds where a Zobrist hash
+    costs tens; every board can afford to be keyed on each lookup.
+    """
+    if position is None:
+        position = board
+    return (position.pawns, position.knights, position.bishops, position.rooks, position.queens, position.kings,
+            position.occupied_co[chess.WHITE], position.occupied_co[chess.BLACK], position.turn,
+            position.clean_castling_rights(), position.ep_square if position.has_legal_en_passant() else None)
+
+def describe_status(position):
+    status = "White's turn" if position.turn else "Black's turn"
+    if position.is_checkmate():
+        winner = "Black" if position.turn else "White"
+        status = f"Checkmate! {winner} wins!"
+    elif position.is_stalemate():
+        status = "Stalemate!"
+    elif position.is_check():
+        status = "Check!"
+    return status
+
+def game_status(position=None):
+    if position is None:
+        position = board
+    key = position_key(position)
+    status = position_status_cache.get(key)
+    if status is None:
+        status = describe_status(position)
+        position_status_cache.put(key, status)
+    return status
+
+def move_san(move, position=None):
+    if position is None:
+        position = board
+    key = (position_key(position), move)
+    san = san_cache.get(key)
+    if san is None:
+        san = position.san(move)
+        san_cache.put(key, san)
+    return san
+
+book_cache = LRUCache(512)
+
+def book_suggestions(position=None):
+    """SAN of the most played book moves in position, best first; empty when out of book"""
+    if opening_book is None:
+        return ()
+    if position is None:
+        position = board
+    key = position_key(position)
+    suggestions = book_cache.get(key)
+    if suggestions is None:
+        entries = [entry for entry in opening_book.find_all(position) if position.is_legal(entry.move)]
+        entries.sort(key=lambda entry: entry.weight, reverse=True)
+        suggestions = tuple(move_san(entry.move, position) for entry in entries[:BOOK_SUGGESTIONS])
+        book_cache.put(key, suggestions)
+    return suggestions
+
+# Tablebase results by position key: (wdl, dtz), or () when a table is missing
+tablebase_cache = LRUCache(1024)
+tablebase_requests = queue.Queue()
+WDL_NAMES = {2: 'win', 1: 'cursed win', 0: 'draw', -1: 'blessed loss', -2: 'loss'}
+
+def request_tablebase_probe(position=None):
+    """Queue position for the tablebase thread if the tables cover it and it has not been probed"""
+    if tablebase is None:
+        return
+    if position is None:
+        position = board
+    if chess.popcount(position.occupied) > tablebase_max_pieces or position.castling_rights:
+        return
+    key = position_key(position)
+    if tablebase_cache.get(key) is None:
+        tablebase_requests.put((key, position.copy(stack=False)))
+
+def tablebase_thread():
+    """Probe queued positions off the UI thread; the status line picks the results up from the cache"""
+    while True:
+        key, position = tablebase_requests.get()
+        if tablebase_cache.get(key) is not None:
+            continue
+        try:
+            result = (tablebase.probe_wdl(position), tablebase.probe_dtz(position))
+        except KeyError as e:  # MissingTableError
+            if DEBUG:
+                tracing.log('debug', 'tablebase probe failed', error=str(e))
+            result = ()
+        tablebase_cache.put(key, result)
+        pygame.event.post(pygame.event.Event(REDRAW_EVENT))
+
+def tablebase_status(position=None):
+    """Tablebase verdict for the side to move, e.g. 'win, DTZ 13'; empty until probed"""
+    if tablebase is None:
+        return ""
+    result = tablebase_cache.get(position_key(position))
+    if not result:
+        return ""
+    wdl, dtz = result
+    return f"{WDL_NAMES[wdl]}, DTZ {abs(dtz)}" if dtz else WDL_NAMES[wdl]
+
+def status_lines():
+    """Collect the texts shown in the status area so frames can be compared without drawing"""
+    heard_text = f"Heard: {game_state.recognized_text}" if game_state.recognized_text else ""
+    status = game_status()
+    suggestions = book_suggestions()
+    if suggestions:
+        status = f"{status}   Book: {', '.join(suggestions)}"
+    verdict = tablebase_status()
+    if verdict:
+        status = f"{status}   Tablebase: {verdict}"
+    health = audio_health()
+    if health:
+        status = f"{status}   Audio: {health}"
+    
+    with game_state.lock:
+        if game_state.model_state == 'loading':
+            elapsed = time.perf_counter() - STARTUP_START
+            prompt_text, prompt_color = f"Loading speech model... ({int(elapsed)}s)", BLUE
+        elif game_state.listening:
+            remaining = max(0, MAX_LISTEN_TIME - (time.time() - game_state.listen_start_time))
+            prompt_text, prompt_color = f"Listening... ({int(remaining)}s)", RED
+        elif game_state.confirming_move and game_state.pending_move:
+            if isinstance(game_state.pending_move, chess.Move):
+                move_text = move_san(game_state.pending_move)
+            else:
+                move_text = game_state.pending_move
+            prompt_text, prompt_color = f"Confirm move: {move_text}? (Y/N)", BLUE
         else:
-            move_text = pending_move
-        confirm_text = f"Confirm move: {move_text}? (Y/N)"
-        text_surface = font.render(confirm_text, True, BLUE)
-        screen.blit(text_surface, (10, HEIGHT - 25))
-    elif status_message:
-        text_surface = font.render(status_message, True, BLACK)
-        screen.blit(text_surface, (10, HEIGHT - 25))
-def draw_status():
-    global status_message, recognized_text, pending_move, confirming_move, audio_level, listening
-    
-    pygame.draw.rect(screen, WHITE, pygame.Rect(0, HEIGHT - 50, WIDTH, 50))
-    pygame.draw.line(screen, BLACK, (0, HEIGHT - 50), (WIDTH, HEIGHT - 50))
+            prompt_text, prompt_color = game_state.status_message, BLACK
     
-    font = pygame.font.Font(None, 30)
+    return status, heard_text, prompt_text, prompt_color
+
+def audio_health():
+    """Overflows and dropped audio reported by the speech process, or '' while there are none"""
+    overflows, dropped = audio_ring.overflows, audio_ring.dropped
+    if not overflows and not dropped:
+        return ""
+    return f"{overflows} overflows, {dropped / SAMPLE_RATE:.1f}s dropped"
+
+def audio_bar_width():
+    """Width of the green audio level bar, or None when it is hidden"""
+    if not game_state.listening:
+        return None
+    return int(min(game_state.audio_level * 2000, AUDIO_BAR_RECT.width))
+
+def draw_status(lines=None, bar_width=None):
+    if lines is None:
+        lines = status_lines()
+        bar_width = audio_bar_width()
+    game_status, heard_text, prompt_text, prompt_color = lines
     
-    game_status = "White's turn" if board.turn else "Black's turn"
-    if board.is_checkmate():
-        winner = "Black" if board.turn else "White"
-        game_status = f"Checkmate! {winner} wins!"
-    elif board.is_stalemate():
-        game_status = "Stalemate!"
-    elif board.is_check():
-        game_status = "Check!"
+    pygame.draw.rect(screen, WHITE, STATUS_PANEL_RECT)
+    pygame.draw.line(screen, BLACK, (0, HEIGHT - 50), (WIDTH, HEIGHT - 50))
     
-    text_surface = font.render(game_status, True, BLACK)
-    screen.blit(text_surface, (10, HEIGHT - 90))
+    screen.blit(render_text(game_status, 30, BLACK), (10, HEIGHT - 90))
     
-    if recognized_text:
-        text_surface = font.render(f"Heard: {recognized_text}", True, BLACK)
-        screen.blit(text_surface, (10, HEIGHT - 50))
+    if heard_text:
+        screen.blit(render_text(heard_text, 30, BLACK), (10, HEIGHT - 50))
     
-    if listening:
-        # If we have the listen_start_time in scope, use it for countdown
-        try:
-            remaining = MAX_LISTEN_TIME - (time.time() - listen_start_time)
-            listening_text = f"Listening... ({int(remaining)}s)"
-        except:
-            listening_text = "Listening for move..."
-            
-        text_surface = font.render(listening_text, True, RED)
-        screen.blit(text_surface, (10, HEIGHT - 25))
-        
-        # Enhance the audio level visualization
-        bar_max_width = 200
-        bar_width = int(min(audio_level * 2000, bar_max_width))
-        pygame.draw.rect(screen, (0, 200, 0), pygame.Rect(WIDTH - 220, HEIGHT - 25, bar_width, 20))
-        pygame.draw.rect(screen, (200, 200, 200), pygame.Rect(WIDTH - 220 + bar_width, HEIGHT - 25, bar_max_width - bar_width, 20), 1)
-    elif confirming_move and pending_move:
-        if isinstance(pending_move, chess.Move):
-            move_text = board.san(pending_move)
+    if prompt_text:
+        screen.blit(render_text(prompt_text, 30, prompt_color), (10, HEIGHT - 25))
+    
+    if bar_width is not None:
+        # Audio level visualization
+        pygame.draw.rect(screen, (0, 200, 0), pygame.Rect(AUDIO_BAR_RECT.x, AUDIO_BAR_RECT.y, bar_width, AUDIO_BAR_RECT.height))
+        pygame.draw.rect(screen, (200, 200, 200), pygame.Rect(AUDIO_BAR_RECT.x + bar_width, AUDIO_BAR_RECT.y, AUDIO_BAR_RECT.width - bar_width, AUDIO_BAR_RECT.height), 1)
+
+# Snapshot of everything visible on screen, compared between frames to find dirty regions
+def frame_state(last_move, show_help, show_trace=False):
+    return {
+        'pieces': board.piece_map(),
+        'highlight': {last_move.from_square, last_move.to_square} if last_move else set(),
+        'status': status_lines(),
+        'audio_bar': audio_bar_width(),
+        'help': show_help,
+        'trace': tracer.version if show_trace else None,
+        'loading': game_state.model_state == 'loading',
+    }
+
+def wait_timeout():
+    """Milliseconds the main loop may sleep, or 0 to sleep until an event arrives.
+    
+    Everything else that changes the screen arrives as an event, so only the loading and
+    listening countdowns and a pending journal sync need a timed wake-up.
+    """
+    timeouts = []
+    if game_state.model_state == 'loading':
+        timeouts.append(1.0 - (time.perf_counter() - STARTUP_START) % 1.0)
+    elif game_state.listening:
+        remaining = MAX_LISTEN_TIME - (time.time() - game_state.listen_start_time)
+        if remaining > 0:
+            timeouts.append(remaining % 1.0)
         else:
-            move_text = pending_move
-        confirm_text = f"Confirm move: {move_text}? (Y/N)"
-        text_surface = font.render(confirm_text, True, BLUE)
-        screen.blit(text_surface, (10, HEIGHT - 25))
-    elif status_message:
-        text_surface = font.render(status_message, True, BLACK)
-        screen.blit(text_surface, (10, HEIGHT - 25))
+            timeouts.append(max(0.0, remaining + LISTEN_GRACE_TIME))
+    sync_due = move_journal.sync_due_in()
+    if sync_due is not None:
+        timeouts.append(sync_due)
+    if not timeouts:
+        return 0
+    return int(min(timeouts) * 1000) + 1
+
+def listening_stalled():
+    """True when the utterance in progress can no longer end on its own: the speech process
+    has died, or it has not reported LISTEN_GRACE_TIME past the listening deadline"""
+    if not speech_process.process.is_alive():
+        return True
+    return time.time() - game_state.listen_start_time > MAX_LISTEN_TIME + LISTEN_GRACE_TIME
+
+def square_rect(square):
+    square_size = WIDTH // 8
+    return pygame.Rect(chess.square_file(square) * square_size, (7 - chess.square_rank(square)) * square_size,
+                       square_size, square_size)
+
+def dirty_rects(previous, current):
+    """Return the screen rectangles that differ between two frame states"""
+    if (previous is None or previous['help'] != current['help'] or previous['trace'] != current['trace']
+            or previous['loading'] != current['loading']):
+        return [screen.get_rect()]
+    
+    rects = []
+    changed_squares = current['highlight'] ^ previous['highlight']
+    for square in set(previous['pieces']) | set(current['pieces']):
+        if previous['pieces'].get(square) != current['pieces'].get(square):
+            changed_squares.add(square)
+    rects.extend(square_rect(square) for square in changed_squares)
+    
+    if previous['status'][0] != current['status'][0]:
+        rects.append(GAME_STATUS_RECT)
+    if previous['status'][1:] != current['status'][1:] or (previous['audio_bar'] is None) != (current['audio_bar'] is None):
+        rects.append(STATUS_PANEL_RECT)
+    elif previous['audio_bar'] != current['audio_bar']:
+        rects.append(AUDIO_BAR_RECT)
+    return rects
+
+def draw_scene(state, last_move, area):
+    """Redraw the part of the scene inside area; drawing is clipped so untouched pixels stay as they are"""
+    screen.set_clip(area)
+    screen.fill(WHITE, area)
+    draw_board(last_move, area)
+    draw_pieces(area)
+    draw_status(state['status'], state['audio_bar'])
+    if state['loading']:
+        draw_loading_banner()
+    if state['help']:
+        draw_help_overlay()
+    if state['trace'] is not None:
+        draw_trace_overlay()
+    screen.set_clip(None)
+
+def draw_loading_banner():
+    banner = pygame.Rect(0, 0, WIDTH - 150, 60)
+    banner.center = (WIDTH // 2, WIDTH // 2)
+    pygame.draw.rect(screen, WHITE, banner)
+    pygame.draw.rect(screen, BLUE, banner, 2)
+    text = render_text("Loading speech model...", 36, BLUE)
+    screen.blit(text, text.get_rect(center=banner.center))
+
 def filter_repeated_words(text):
     words = text.split()
     filtered_words = []
@@ -222,607 +563,1568 @@ def filter_repeated_words(text):
         filtered_words.append(word)
     
     return " ".join(filtered_words)
-def voice_listener_thread(model):
-    global status_message, listening, audio_level
+class AudioRing:
+    """Fixed-size ring of 16-bit samples, written by the capture callback and read by the listener.
+    
+    Positions are counts of samples ever written, so a reader can resume where it left off or
+    step back to replay the most recent audio. Samples and counters live in shared memory, so
+    the ring can be handed to the speech process and the UI reads the counters without any
+    audio being copied between processes.
+    """
+    
+    # Slots of the shared counters
+    WRITTEN, OVERFLOWS, DROPPED = range(3)
+    
+    def __init__(self, capacity, context=None):
+        if context is None:
+            context = multiprocessing.get_context('spawn')
+        self.capacity = capacity
+        self.samples = context.RawArray('h', capacity)
+        self.counters = context.RawArray('q', 3)
+        self.condition = context.Condition()
+        self.buffer = np.frombuffer(self.samples, dtype=np.int16)
+    
+    def __getstate__(self):
+        # The numpy view is rebuilt over the shared samples rather than pickled as a copy
+        state = self.__dict__.copy()
+        del state['buffer']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.buffer = np.frombuffer(self.samples, dtype=np.int16)
+    
+    @property
+    def written(self):
+        return self.counters[self.WRITTEN]
+    
+    @written.setter
+    def written(self, value):
+        self.counters[self.WRITTEN] = value
+    
+    @property
+    def overflows(self):
+        """Capture callbacks that reported an input overflow"""
+        return self.counters[self.OVERFLOWS]
+    
+    @overflows.setter
+    def overflows(self, value):
+        self.counters[self.OVERFLOWS] = value
+    
+    @property
+    def dropped(self):
+        """Samples overwritten before the reader got to them"""
+        return self.counters[self.DROPPED]
+    
+    @dropped.setter
+    def dropped(self, value):
+        self.counters[self.DROPPED] = value
+    
+    def write(self, samples):
+        with self.condition:
+            if len(samples) > self.capacity:
+                self.written += len(samples) - self.capacity
+                samples = samples[-self.capacity:]
+            start = self.written % self.capacity
+            first = min(len(samples), self.capacity - start)
+            self.buffer[start:start + first] = samples[:first]
+            self.buffer[:len(samples) - first] = samples[first:]
+            self.written += len(samples)
+            self.condition.notify_all()
+    
+    def read(self, position, timeout=None):
+        """Return (samples written since position, new position), waiting up to timeout for audio"""
+        with self.condition:
+            if self.written == position:
+                self.condition.wait(timeout)
+            oldest = max(0, self.written - self.capacity)
+            if position < oldest:
+                self.dropped += oldest - position
+                position = oldest
+            count = self.written - position
+            start = position % self.capacity
+            first = min(count, self.capacity - start)
+            samples = np.concatenate((self.buffer[start:start + first], self.buffer[:count - first]))
+            return samples, self.written
+
+# Capture feeds the ring continuously; the last PREROLL_SECONDS are replayed when listening starts
+SAMPLE_RATE = 16000
+CAPTURE_FRAMES = 800  # 50 ms per callback
+PREROLL_SECONDS = 0.5
+audio_ring = AudioRing(SAMPLE_RATE * 2)
+# Speech process; the UI sends it commands and receives the recognized text
+speech_process = None
+# Stage timestamps of the utterance in progress and of the recent ones
+tracer = tracing.Tracer()
+
+# Events posted to the main loop, which sleeps in pygame.event.wait until one arrives
+SPEECH_EVENT = pygame.USEREVENT      # message: (kind, value) from the speech process
+ENGINE_EVENT = pygame.USEREVENT + 1  # message: (request id, result) from the engine process
+REDRAW_EVENT = pygame.USEREVENT + 2  # a background thread changed something on screen
+
+def relay_thread(messages, event_type):
+    """Turn every message a process puts on the messages queue into a pygame event"""
+    while True:
+        try:
+            message = messages.get()
+            pygame.event.post(pygame.event.Event(event_type, message=message))
+        except (EOFError, OSError, pygame.error):  # Queue closed or pygame shut down at exit
+            return
+
+class FrameVAD:
+    """Voice activity detector over short frames using energy and zero-crossing rate.
+    
+    The noise floor is calibrated from background audio and keeps tracking it on frames
+    judged to be non-speech. Works on plain int16 arrays, so it can be run on recordings.
+    """
+    
+    FRAME_SECONDS = 0.02
+    # Fricatives ("six", "f") are quiet but cross zero often; they count as speech at half the margin
+    FRICATIVE_ZCR = 0.25
+    FLOOR_RISE = 0.05
+    FLOOR_FALL = 0.3
+    
+    def __init__(self, sample_rate=SAMPLE_RATE, margin_db=VAD_MARGIN_DB, hangover=ENDPOINT_HANGOVER):
+        self.frame_length = int(sample_rate * self.FRAME_SECONDS)
+        self.margin_db = margin_db
+        self.hangover_frames = max(1, int(round(hangover / self.FRAME_SECONDS)))
+        self.noise_floor_db = None
+        self.reset()
+    
+    def reset(self):
+        """Forget the current utterance but keep the noise floor"""
+        self.leftover = np.zeros(0, dtype=np.int16)
+        self.speech_seen = False
+        self.silent_frames = 0
+    
+    def frame_features(self, samples):
+        """Energy in dB and zero-crossing rate of every complete frame"""
+        count = len(samples) // self.frame_length
+        frames = samples[:count * self.frame_length].reshape(count, self.frame_length).astype(np.float32)
+        energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1.0)
+        zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+        return energy_db, zcr
+    
+    def calibrate(self, samples):
+        energy_db, _ = self.frame_features(np.asarray(samples, dtype=np.int16))
+        if len(energy_db):
+            self.noise_floor_db = float(np.percentile(energy_db, 50))
+    
+    def process(self, samples):
+        """Classify the frames in samples (plus any leftover) and return one speech flag per frame"""
+        samples = np.concatenate((self.leftover, np.asarray(samples, dtype=np.int16)))
+        count = len(samples) // self.frame_length
+        self.leftover = samples[count * self.frame_length:]
+        if not count:
+            return np.zeros(0, dtype=bool)
+        
+        energy_db, zcr = self.frame_features(samples)
+        if self.noise_floor_db is None:
+            self.noise_floor_db = float(np.percentile(energy_db, 20))
+        
+        threshold = self.noise_floor_db + self.margin_db
+        speech = (energy_db > threshold) | ((energy_db > threshold - self.margin_db / 2) & (zcr > self.FRICATIVE_ZCR))
+        
+        # Track the floor on non-speech frames: follow drops quickly and rises slowly
+        quiet = energy_db[~speech]
+        if len(quiet):
+            level = float(np.mean(quiet))
+            rate = self.FLOOR_FALL if level < self.noise_floor_db else self.FLOOR_RISE
+            self.noise_floor_db += rate * (level - self.noise_floor_db)
+        
+        # Hangover counts trailing non-speech frames since the last speech frame
+        voiced = np.flatnonzero(speech)
+        if len(voiced):
+            self.speech_seen = True
+            self.silent_frames = count - 1 - voiced[-1]
+        else:
+            self.silent_frames += count
+        return speech
+    
+    @property
+    def endpoint(self):
+        """True once speech has been heard and followed by the hangover's worth of non-speech"""
+        return self.speech_seen and self.silent_frames >= self.hangover_frames
+
+class PyAudioSource:
+    """Microphone capture through PyAudio callbacks"""
     
-    if model is None:
-        print("No speech model available")
+    def __init__(self, chunk_frames=CAPTURE_FRAMES):
+        self.chunk_frames = chunk_frames
+        self.audio = None
+        self.stream = None
+    
+    def start(self, ring):
+        if pyaudio is None:
+            raise RuntimeError("PyAudio is not installed; install it or use a WavFileSource")
+        
+        def callback(in_data, frame_count, time_info, status):
+            if status & pyaudio.paInputOverflow:
+                ring.overflows += 1
+            ring.write(np.frombuffer(in_data, dtype=np.int16))
+            return None, pyaudio.paContinue
+        
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paInt16, 
+                                      channels=1, 
+                                      rate=SAMPLE_RATE, 
+                                      input=True, 
+                                      frames_per_buffer=self.chunk_frames,
+                                      stream_callback=callback)
+        self.stream.start_stream()
+    
+    def stop(self):
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
+        if self.audio:
+            self.audio.terminate()
+
+class WavFileSource:
+    """Plays a WAV file (16 kHz, mono, 16-bit) into the ring at real-time pace, then silence.
+    
+    Stands in for the microphone in headless runs; start_time records when playback began,
+    so the file's audio ends at start_time + duration.
+    """
+    
+    def __init__(self, path, chunk_frames=CAPTURE_FRAMES, trailing_silence=MAX_LISTEN_TIME):
+        with wave.open(path, 'rb') as wav:
+            if wav.getframerate() != SAMPLE_RATE or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                raise ValueError(f"{path}: expected 16 kHz mono 16-bit audio")
+            self.samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        self.chunk_frames = chunk_frames
+        self.trailing_silence = trailing_silence
+        self.start_time = None
+        self.stopped = threading.Event()
+        self.thread = None
+    
+    @property
+    def duration(self):
+        return len(self.samples) / SAMPLE_RATE
+    
+    def start(self, ring):
+        self.thread = threading.Thread(target=self.play, args=(ring,), daemon=True)
+        self.thread.start()
+    
+    def play(self, ring):
+        chunk_seconds = self.chunk_frames / SAMPLE_RATE
+        silence = np.zeros(self.chunk_frames, dtype=np.int16)
+        silent_chunks = int(self.trailing_silence / chunk_seconds)
+        next_time = self.start_time = time.perf_counter()
+        chunks = [self.samples[i:i + self.chunk_frames] for i in range(0, len(self.samples), self.chunk_frames)]
+        for chunk in chunks + [silence] * silent_chunks:
+            if self.stopped.is_set():
+                return
+            ring.write(chunk)
+            next_time += chunk_seconds
+            self.stopped.wait(max(0.0, next_time - time.perf_counter()))
+    
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+def process_recognized_text(raw_text, marks=None):
+    try:
+        # First filter out repetitions
+        filtered_text = filter_repeated_words(raw_text)
+        tracing.stamp(marks, 'filter')
+        # Then process as usual
+        processed_text = preprocess_speech_input(filtered_text)
+        tracing.stamp(marks, 'normalize')
+        if DEBUG:
+            tracing.log('debug', 'recognized', raw=raw_text, filtered=filtered_text, processed=processed_text)
+        return processed_text
+    except Exception as e:
+        tracing.log('error', 'processing failed', text=raw_text, error=str(e))
+        return raw_text
+
+def best_alternative(result, position):
+    """Pick the recognizer alternative that best names a legal move in position.
+    
+    Each alternative is scored by its parse (one legal move beats several, several beat none)
+    plus its confidence relative to the top alternative. Alternatives that normalize to the
+    same text are parsed once. Falls back to the top alternative when none names a legal move.
+    """
+    alternatives = [alt for alt in result.get("alternatives", []) if alt.get("text")]
+    if not alternatives:
+        return result.get("text", "")
+    
+    top_confidence = alternatives[0].get("confidence", 0.0)
+    parses = {}
+    best_text, best_score = None, None
+    for alt in alternatives:
+        normalized = cached_normalize(filter_repeated_words(alt["text"]))
+        if normalized not in parses:
+            moves, _ = command_candidates(normalized, position)
+            parses[normalized] = 0.0 if not moves else (1.0 if len(moves) == 1 else 0.5)
+        if not parses[normalized]:
+            continue
+        # Confidences are unnormalized log scores; scale the gap to the top alternative
+        score = parses[normalized] + (alt.get("confidence", 0.0) - top_confidence) / 100.0
+        if best_score is None or score > best_score:
+            best_text, best_score = alt["text"], score
+    
+    if best_text is None:
+        return alternatives[0]["text"]
+    if DEBUG and best_text != alternatives[0]["text"]:
+        tracing.log('debug', 'rescored', top=alternatives[0]["text"], chosen=best_text)
+    return best_text
+
+def listen_for_command(rec, vad, ring, listen_board, stats=None, on_partial=None, on_level=None, marks=None,
+                       stop=None):
+    """Decode one utterance from ring, starting with the pre-roll, until the endpoint.
+    
+    Returns the recognized text ('' if nothing was recognized) or None on timeout. Stops early,
+    returning '', once stop (an Event, if given) is set. on_level, if given, gets the input level
+    of every block read.
+    stats, if given, collects seconds spent in VAD and decoding and the seconds of audio decoded;
+    marks, if given, gets the 'voiced', 'endpoint' and 'final' trace stamps.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(vad=0.0, decode=0.0, audio=0.0)
+    listen_start_time = time.time()
+    # Start with the pre-roll so the first syllable spoken before SPACE isn't lost
+    position = max(0, ring.written - int(PREROLL_SECONDS * SAMPLE_RATE))
+    partial_text = ""
+    partial_move = None
+    partial_since = 0
+    
+    while stop is None or not stop.is_set():
+        current_time = time.time()
+        
+        # Check for timeout
+        if current_time - listen_start_time > MAX_LISTEN_TIME:
+            return None
+        
+        audio_array, position = ring.read(position, timeout=0.1)
+        if not len(audio_array):
+            continue
+        data = audio_array.tobytes()
+        if on_level:
+            on_level(np.abs(audio_array).mean() / 10000.0)
+        stats['audio'] += len(audio_array) / SAMPLE_RATE
+        
+        # Endpoint once speech has been followed by ENDPOINT_HANGOVER of non-speech
+        stage_start = time.perf_counter()
+        vad.process(audio_array)
+        stats['vad'] += time.perf_counter() - stage_start
+        if vad.speech_seen:
+            tracing.stamp(marks, 'voiced')
+        if vad.endpoint:
+            tracing.stamp(marks, 'endpoint')
+            if DEBUG:
+                tracing.log('debug', 'endpoint', reason='silence')
+            stage_start = time.perf_counter()
+            result = json.loads(rec.FinalResult())
+            stats['decode'] += time.perf_counter() - stage_start
+            text = best_alternative(result, listen_board)
+            tracing.stamp(marks, 'final')
+            return text
+        
+        stage_start = time.perf_counter()
+        final = rec.AcceptWaveform(data)
+        result = json.loads(rec.Result() if final else rec.PartialResult())
+        stats['decode'] += time.perf_counter() - stage_start
+        if final:
+            text = best_alternative(result, listen_board)
+            if text:
+                tracing.stamp(marks, 'endpoint')
+                tracing.stamp(marks, 'final')
+                if DEBUG:
+                    tracing.log('debug', 'endpoint', reason='recognizer')
+                return text
+        elif "partial" in result and result["partial"] and len(result["partial"]) > 3:
+            if result["partial"] != partial_text:
+                partial_text = result["partial"]
+                if on_partial:
+                    on_partial(partial_text)
+                normalized = normalize_utterance(filter_repeated_words(partial_text))
+                moves, _ = command_candidates(normalized, listen_board)
+                move = moves[0] if len(moves) == 1 else None
+                if move != partial_move:
+                    partial_move = move
+                    partial_since = current_time
+            # Commit early once the partial has named one legal move for long enough
+            if partial_move and current_time - partial_since >= PARTIAL_STABLE_SECONDS:
+                tracing.stamp(marks, 'endpoint')
+                if DEBUG:
+                    tracing.log('debug', 'endpoint', reason='stable partial', text=partial_text)
+                rec.Reset()
+                tracing.stamp(marks, 'final')
+                return partial_text
+    return ""
+
+def speech_worker(grammar, ring, commands, results, stop, make_source=PyAudioSource):
+    """Body of the speech process: loads the model, captures into ring and decodes on request.
+    
+    make_source is called in the speech process to create the audio source, so it has to be
+    picklable: a class or a functools.partial of one, such as partial(WavFileSource, path).
+    Commands are ('grammar', grammar), ('prepare', fen), ('listen', fen) and None to stop.
+    'prepare' builds the move index of a position the next command may be spoken in, between
+    utterances, so its partials and alternatives don't pay for it. Setting the stop
+    Event cuts the utterance in progress short. Results are
+    ('ready', startup timings), ('failed', status message), ('level', input level),
+    ('trace', stage stamps), ('text', recognized text) and ('done', None) once an utterance
+    is over. Audio never leaves the shared ring.
+    """
+    global recognizer_grammar
+    
+    recognizer_grammar = grammar
+    timings = {}
+    phase_start = time.perf_counter()
+    model = setup_vosk()
+    timings['model load'] = time.perf_counter() - phase_start
+    if not model:
+        tracing.log('error', 'speech setup failed')
+        results.put(('failed', "Speech model not found. See console for details."))
         return
     
-    p = pyaudio.PyAudio()
+    phase_start = time.perf_counter()
+    warm_up_model(model)
+    timings['warm-up'] = time.perf_counter() - phase_start
+    results.put(('ready', timings))
     
+    source = make_source()
     try:
-        stream = p.open(format=pyaudio.paInt16, 
-                        channels=1, 
-                        rate=16000, 
-                        input=True, 
-                        frames_per_buffer=4000)
-        stream.start_stream()
+        source.start(ring)
         
-        rec = vosk.KaldiRecognizer(model, 16000)
+        applied_grammar = recognizer_grammar
+        if USE_GRAMMAR and applied_grammar:
+            rec = vosk.KaldiRecognizer(model, SAMPLE_RATE, applied_grammar)
+        else:
+            rec = vosk.KaldiRecognizer(model, SAMPLE_RATE)
         rec.SetWords(True)
+        rec.SetMaxAlternatives(MAX_ALTERNATIVES)
         
-        print("Voice recognition system is ready")
+        # Calibrate the noise floor from the first half second of background audio
+        vad = FrameVAD()
+        calibration_samples = int(0.5 * SAMPLE_RATE)
+        deadline = time.time() + 2.0
+        position = 0
+        while position < calibration_samples and time.time() < deadline:
+            _, position = ring.read(position, timeout=0.1)
+        if position:
+            vad.calibrate(ring.read(max(0, position - calibration_samples), timeout=0)[0])
+        else:
+            # No audio yet; the VAD takes its floor from the first utterance instead
+            tracing.log('warning', 'no audio for calibration')
         
-        # Initialize timing variables inside this function
-        listen_start_time = 0
-        last_sound_time = 0
+        tracing.log('info', 'speech ready')
         
         while True:
-            if listening:
-                current_time = time.time()
-                
-                # Start timer when listening begins
-                if listen_start_time == 0:
-                    listen_start_time = current_time
-                    last_sound_time = current_time  # Also initialize last_sound_time
-                
-                # Check for timeout
-                if current_time - listen_start_time > MAX_LISTEN_TIME:
-                    print("Listening timeout reached")
-                    speech_queue.put("[Timeout - no clear command detected]")
-                    listening = False
-                    listen_start_time = 0
-                    continue
-                
-                data = stream.read(2000, exception_on_overflow=False)
-                audio_array = np.frombuffer(data, dtype=np.int16)
-                audio_level = np.abs(audio_array).mean() / 10000.0
-                
-                # Sound detection logic
-                if audio_level > SILENCE_THRESHOLD / 10000.0:
-                    last_sound_time = current_time
-                elif last_sound_time > 0 and current_time - last_sound_time > SILENCE_DURATION:
-                    # If silence for SILENCE_DURATION seconds after speech was detected
-                    print("Silence detected, finalizing recognition")
-                    result = json.loads(rec.FinalResult())
-                    if "text" in result and result["text"]:
-                        raw_text = result["text"]
-                        try:
-                            # First filter out repetitions
-                            filtered_text = filter_repeated_words(raw_text)
-                            # Then process as usual
-                            processed_text = preprocess_speech_input(filtered_text)
-                            if DEBUG:
-                                print(f"Raw recognition: '{raw_text}'")
-                                print(f"After filtering repetitions: '{filtered_text}'")
-                                print(f"After preprocessing: '{processed_text}'")
-                            speech_queue.put(processed_text)
-                        except Exception as e:
-                            print(f"Error processing text '{raw_text}': {e}")
-                            speech_queue.put(raw_text)
-                    listening = False
-                    listen_start_time = 0
-                    last_sound_time = 0
-                    continue
-                
-                if rec.AcceptWaveform(data):
-                    result = json.loads(rec.Result())
-                    if "text" in result and result["text"]:
-                        raw_text = result["text"]
-                        try:
-                            # First filter out repetitions
-                            filtered_text = filter_repeated_words(raw_text)
-                            # Then process as usual
-                            processed_text = preprocess_speech_input(filtered_text)
-                            if DEBUG:
-                                print(f"Raw recognition: '{raw_text}'")
-                                print(f"After filtering repetitions: '{filtered_text}'")
-                                print(f"After preprocessing: '{processed_text}'")
-                            speech_queue.put(processed_text)
-                            listening = False
-                            listen_start_time = 0
-                        except Exception as e:
-                            print(f"Error processing text '{raw_text}': {e}")
-                            speech_queue.put(raw_text)
-                            listening = False
-                            listen_start_time = 0
-                else:
-                    partial = json.loads(rec.PartialResult())
-                    if "partial" in partial and partial["partial"] and len(partial["partial"]) > 3:
-                        speech_queue.put(f"Partial: {partial['partial']}")
-            else:
-                listen_start_time = 0  # Reset timer when not listening
-                last_sound_time = 0    # Reset silence timer when not listening
-                time.sleep(0.1)
+            command = commands.get()
+            if command is None:
+                break
+            kind, value = command
+            if kind == 'prepare':
+                move_index(chess.Board(value))
+                continue
+            if kind == 'grammar':
+                # Switch grammars between utterances, as soon as the position changes, so the
+                # first command in a new position does not wait for it
+                if USE_GRAMMAR and value != applied_grammar:
+                    applied_grammar = value
+                    rec.SetGrammar(applied_grammar)
+                continue
+            
+            vad.reset()
+            rec.Reset()
+            marks = {} if TRACING else None
+            # Partials and alternatives are resolved against the position the command is spoken in
+            text = listen_for_command(rec, vad, ring, chess.Board(value),
+                                      on_partial=lambda partial: results.put(('text', f"Partial: {partial}")),
+                                      on_level=lambda level: results.put(('level', level)), marks=marks, stop=stop)
+            if text is None:
+                tracing.log('info', 'listening timeout')
+                results.put(('text', "[Timeout - no clear command detected]"))
+            elif text:
+                text = process_recognized_text(text, marks)
+                if marks:
+                    results.put(('trace', marks))
+                results.put(('text', text))
+            results.put(('done', None))
     
     except Exception as e:
-        print(f"Error in voice listener thread: {e}")
+        tracing.log('error', 'speech process failed', error=str(e))
+        results.put(('failed', "Speech recognition stopped. See console for details."))
     finally:
-        if 'stream' in locals():
-            stream.stop_stream()
-            stream.close()
-        p.terminate()
+        source.stop()
+
+class SpeechProcess:
+    """Runs capture and decoding in a separate process so recognition never competes with drawing.
+    
+    The capture callback and the decoder share ring; the UI only exchanges short messages with
+    the process, which relay_thread turns into SPEECH_EVENTs, and reads the overflow counters
+    straight from the ring.
+    """
+    
+    def __init__(self, ring, make_source=PyAudioSource):
+        # Spawn rather than fork: the game process already runs pygame and other threads
+        context = multiprocessing.get_context('spawn')
+        self.ring = ring
+        self.commands = context.Queue()
+        self.results = context.Queue()
+        self.stop = context.Event()
+        self.process = context.Process(target=speech_worker,
+                                       args=(recognizer_grammar, ring, self.commands, self.results, self.stop, make_source),
+                                       daemon=True)
+    
+    def start(self):
+        self.process.start()
+    
+    def listen(self, position):
+        """Decode one command spoken in position; the outcome arrives as SPEECH_EVENTs"""
+        self.stop.clear()
+        self.commands.put(('listen', position.fen()))
+    
+    def cancel(self):
+        """Cut the utterance in progress short; it ends with a 'done' like any other"""
+        self.stop.set()
+    
+    def set_grammar(self, grammar):
+        self.commands.put(('grammar', grammar))
+    
+    def prepare(self, position):
+        """Have the process index position ahead of a command spoken in it"""
+        self.commands.put(('prepare', position.fen()))
+    
+    def close(self, timeout=1.0):
+        if self.process.is_alive():
+            self.commands.put(None)
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+
+def load_config():
+    if not os.path.exists(CONFIG_PATH):
+        return {}
+    try:
+        with open(CONFIG_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        tracing.log('error', 'config unreadable', path=CONFIG_PATH, error=str(e))
+        return {}
+
+def get_model_path():
+    """Model directory from VOSK_MODEL_PATH, then the config file, then the project directory"""
+    return os.environ.get('VOSK_MODEL_PATH') or load_config().get('model_path') or DEFAULT_MODEL_PATH
+
+def get_book_path():
+    """Polyglot book from VOICE_CHESS_BOOK, then the config file, then book.bin in the project directory"""
+    path = os.environ.get('VOICE_CHESS_BOOK') or load_config().get('book_path') or DEFAULT_BOOK_PATH
+    return path if os.path.exists(path) else None
+
+def get_tablebase_path():
+    """Syzygy directory from VOICE_CHESS_SYZYGY, then the config file, then syzygy/ in the project directory"""
+    path = os.environ.get('VOICE_CHESS_SYZYGY') or load_config().get('syzygy_path') or DEFAULT_TABLEBASE_PATH
+    return path if os.path.isdir(path) else None
+
+def open_tablebase(path):
+    """Index the table files in path; nothing is read until a position needs a table"""
+    if not path:
+        return None
+    try:
+        tables = chess.syzygy.open_tablebase(path)
+    except OSError as e:
+        tracing.log('error', 'tablebase unreadable', path=path, error=str(e))
+        return None
+    if not tables.wdl:
+        tracing.log('warning', 'no tablebase files', path=path)
+        tables.close()
+        return None
+    tracing.log('info', 'tablebase', path=path, max_pieces=engine.tablebase_max_pieces(tables))
+    return tables
+
+def open_opening_book(path):
+    """Memory-map a Polyglot book; lookups binary search the file without reading it in"""
+    if not path:
+        return None
+    try:
+        book = chess.polyglot.open_reader(path)
+    except (OSError, ValueError) as e:
+        tracing.log('error', 'opening book unreadable', path=path, error=str(e))
+        return None
+    tracing.log('info', 'opening book', path=path, entries=len(book))
+    return book
+
 # Function to set up Vosk
 def setup_vosk():
-    model_path = r"C:\Users\sabha\OneDrive\Desktop\idea_sprint\vosk-model-en-us-0.22\vosk-model-en-us-0.22"
+    model_path = get_model_path()
     
     if not os.path.isdir(model_path):
-        print(f"Error: Model directory not found at {model_path}")
-        print("Please download the Vosk model from https://alphacephei.com/vosk/models")
-        print("Extract 'vosk-model-small-en-us-0.15' to the specified path.")
+        tracing.log('error', 'model directory not found', path=model_path,
+                    hint=f"download a model from https://alphacephei.com/vosk/models and set "
+                         f"VOSK_MODEL_PATH or \"model_path\" in {CONFIG_PATH}")
         return None
     
     try:
-        print(f"Loading Vosk model from: {model_path}")
+        tracing.log('info', 'loading model', path=model_path)
         model = vosk.Model(model_path)
         return model
     except Exception as e:
-        print(f"Error loading Vosk model: {e}")
+        tracing.log('error', 'model load failed', path=model_path, error=str(e))
         return None
 
+def warm_up_model(model):
+    """Decode half a second of silence so the first real utterance doesn't pay for lazy initialization"""
+    if USE_GRAMMAR and recognizer_grammar:
+        rec = vosk.KaldiRecognizer(model, SAMPLE_RATE, recognizer_grammar)
+    else:
+        rec = vosk.KaldiRecognizer(model, SAMPLE_RATE)
+    # 16-bit samples, two bytes each
+    rec.AcceptWaveform(bytes(SAMPLE_RATE // 2 * 2))
+    rec.FinalResult()
 
-# Preprocess speech input for accent handling
+def print_startup_report():
+    fields = {phase.replace(' ', '_').replace('-', '_') + '_s': round(seconds, 2)
+              for phase, seconds in startup_timings.items()}
+    tracing.log('info', 'startup', **fields)
 
-# Parse voice command into a chess move
-# Improved preprocess_speech_input function with better letter and number recognition
+def print_cache_report():
+    print("Cache hit rates:")
+    for name, cache in (('normalize', normalization_cache), ('parse', parse_cache), ('fuzzy', fuzzy_cache),
+                        ('move index', move_index_cache), ('phrase', phrase_cache), ('move phrase', move_phrase_cache),
+                        ('san', san_cache), ('text', text_cache)):
+        print(f"  {name:<12} {cache.hit_rate():6.1%} of {cache.hits + cache.misses} lookups")
+    print(f"Audio: {audio_ring.overflows} capture overflows, {audio_ring.dropped} samples dropped")
 
-def preprocess_speech_input(text):
-    if DEBUG:
-        print(f"Pre-processing raw input: '{text}'")
-    
-    # Define a comprehensive number mapping dictionary
-    letter_map = {
-        # A variations
-        'ay': 'a', 'hey': 'a', 'they': 'a', 'ai': 'a', 'aa': 'a', 'ae': 'a', 'yea': 'a', 'yeah': 'a', 
-        'at': 'a', 'aye': 'a', 'eh': 'a', 'day': 'a','yay':'a',
-        'en': 'n', 'an': 'n', 'in': 'n', 'end': 'n', 'and': 'n', 'yen': 'n', 'hen': 'n', 'ten': 'n',
-'are': 'r', 'our': 'r', 'or': 'r', 'arr': 'r', 'air': 'r', 'ear': 'r', 'er': 'r', 'ar': 'r',
-'queue': 'q', 'cu': 'q', 'que': 'q', 'cue': 'q', 'kyu': 'q', 'kew': 'q', 'kyou': 'q', 'que': 'q',
-'kay': 'k', 'ca': 'k', 'ka': 'k', 'key': 'k', 'ck': 'k', 'ck': 'k', 'kei': 'k', 'kae': 'k',
-        
-        # B variations
-        'be': 'b', 'bee': 'b', 'me': 'b', 'pee': 'b', 'pe': 'b', 'bi': 'b', 'by': 'b', 'boy': 'b', 'bie': 'b',
-        
-        # C variations
-        'see': 'c', 'sea': 'c', 'cie': 'c', 'she': 'c', 'ci': 'c', 'si': 'c', 'say': 'c', 'cee': 'c',
-        
-        # D variations
-        'dee': 'd', 'de': 'd', 'the': 'd', 'di': 'd', 'dey': 'd', 'day': 'd', 'die': 'd',
-        
-        # E variations
-        'ee': 'e', 'ie': 'e', 'ye': 'e', 'ea': 'e', 'yi': 'e', 'eh': 'e', 'eat': 'e', 'eve': 'e',
-        
-        # F variations
-        'ef': 'f', 'ff': 'f', 'if': 'f', 'aff': 'f', 'eff': 'f', 'afro': 'f', 'foe': 'f','yes':'f',
-        
-        # G variations
-        'jee': 'g', 'gee': 'g', 'ji': 'g', 'je': 'g', 'gi': 'g', 'ge': 'g', 'gay': 'g', 'guy': 'g',
-        
-        # H variations
-        'aitch': 'h', 'age': 'h', 'etch': 'h', 'eh': 'h', 'ach': 'h', 'speech': 'h', 'age': 'h', 'itch': 'h'
-    }
-    number_map = {
-        # 1 variations - augmented list
-        'one': '1', 'van': '1', 'von': '1', 'won': '1', 'fun': '1', 'on': '1', 'run': '1', 'wine': '1', 'wan': '1',
-        'wand': '1', 'want': '1', 'john': '1', 'juan': '1', 'hand': '1', 'an': '1', 'hun': '1', 'done': '1',
-        'none': '1', 'gone': '1', 'some': '1', 'son': '1', 'sun': '1',
-        
-        # 2 variations - augmented list
-        'two': '2', 'to': '2', 'too': '2', 'do': '2', 'tu': '2', 'true': '2', 'tru': '2', 'due': '2', 'tools': '2',
-        'toe': '2', 'new': '2', 'blue': '2', 'who': '2', 'crew': '2', 'through': '2', 'tour': '2', 'dual': '2',
-        'duel': '2', 'cool': '2', 'tune': '2', 'dew': '2', 'shoe': '2', 'chew': '2', 'tell': '2',
-        
-        # 3 variations - augmented list
-        'three': '3', 'tree': '3', 'free': '3', 'sri': '3', 'pre': '3', 'flee': '3', 'the three': '3',
-        'thirty': '3', 'string': '3', 'tricky': '3', 'cream': '3', 'tee': '3', 'real': '3', 'plea': '3',
-        'treat': '3', 'thread': '3', 'trend': '3', 'treaty': '3',
-        
-        # 4 variations - augmented list
-        'four': '4', 'for': '4', 'far': '4', 'fore': '4', 'floor': '4', 'door': '4', 'more': '4', 'form': '4',
-        'ford': '4', 'fourth': '4', 'foreign': '4', 'bore': '4', 'foe': '4', 'fold': '4', 'fort': '4',
-        'forty': '4', 'fall': '4', 'fall': '4', 'foam': '4', 'fork': '4', 'or': '4',
-        
-        # 5 variations - augmented list
-        'five': '5', 'phi': '5', 'hive': '5', 'fife': '5', 'fight': '5', 'file': '5', 'find': '5',
-        'fiver': '5', 'fiber': '5', 'fine': '5', 'fan': '5', 'phone': '5', 'knife': '5', 'life': '5',
-        'wife': '5', 'faith': '5', 'wifi': '5', 'vibe': '5', 'fifth': '5', 'alive': '5','favor':'5','favorite':'5',
-        
-        # 6 variations - augmented list
-        'six': '6', 'sicks': '6', 'sticks': '6', 'sick': '6', 'sex': '6', 'sicks': '6',
-        'sic': '6', 'sax': '6', 'seeks': '6', 'sees': '6', 'sync': '6', 'fix': '6', 'bricks': '6',
-        'mix': '6', 'hits': '6', 'chicks': '6', 'styx': '6', 'sixty': '6', 'sake': '6',
-        
-        # 7 variations - augmented list
-        'seven': '7', 'savin': '7', 'heaven': '7', 'evan': '7', 'kevin': '7', 'eleven': '7',
-        'several': '7', 'seventy': '7', 'seventh': '7', 'sven': '7', 'steven': '7', 'leaven': '7',
-        'devon': '7', 'stefan': '7', 'seven and': '7', 'seven in': '7', 'savvy': '7',
-        
-        # 8 variations - augmented list
-        'eight': '8', 'ate': '8', 'hate': '8', 'late': '8', 'date': '8', 'rate': '8', 'gate': '8',
-        'aide': '8', 'ape': '8', 'eighty': '8', 'at': '8', 'hey': '8', 'fate': '8', 'wait': '8',
-        'great': '8', 'state': '8', 'trait': '8', 'weight': '8', 'mate': '8', 'bait': '8'
-    }
-    
-    # Convert to lowercase and split into words
-    text_lower = text.lower()
-    words = text_lower.split()
-    result_words = []
-    
-    # Process each word, with special handling for numbers
-    for word in words:
-        if word in number_map:
-            result_words.append(number_map[word])
+# Spoken-form tables for accent handling. They are merged into a single lexicon at import
+# time by compile_lexicon(); edit these tables to add new pronunciations.
+
+# File letter and piece letter sounds. Every word here reads as its letter wherever it is
+# heard, so ordinary words ("the", "and", "if", "me", ...) are left out even when a
+# recognizer sometimes mishears a letter as one
+LETTER_SOUNDS = {
+    # A variations
+    'ay': 'a', 'ai': 'a', 'aa': 'a', 'ae': 'a', 'aye': 'a', 'eh': 'a', 'yay': 'a',
+    'en': 'n', 'yen': 'n',
+    'are': 'r', 'arr': 'r', 'ar': 'r',
+    'queue': 'q', 'cu': 'q', 'que': 'q', 'cue': 'q', 'kyu': 'q', 'kew': 'q', 'kyou': 'q',
+    'kay': 'k', 'ca': 'k', 'ka': 'k', 'ck': 'k', 'kei': 'k', 'kae': 'k',
+
+    # B variations
+    'be': 'b', 'bee': 'b', 'pe': 'b', 'bi': 'b', 'bie': 'b',
+
+    # C variations
+    'see': 'c', 'sea': 'c', 'cie': 'c', 'ci': 'c', 'si': 'c', 'cee': 'c',
+
+    # D variations
+    'dee': 'd', 'de': 'd', 'di': 'd', 'dey': 'd',
+
+    # E variations
+    'ee': 'e', 'ie': 'e', 'ye': 'e', 'ea': 'e', 'yi': 'e',
+
+    # F variations
+    'ef': 'f', 'ff': 'f', 'aff': 'f', 'eff': 'f',
+
+    # G variations
+    'jee': 'g', 'gee': 'g', 'ji': 'g', 'je': 'g', 'gi': 'g', 'ge': 'g',
+
+    # H variations
+    'aitch': 'h', 'ach': 'h'
+}
+
+# Rank sounds
+NUMBER_SOUNDS = {
+    # 1 variations - augmented list
+    'one': '1', 'van': '1', 'von': '1', 'won': '1', 'fun': '1', 'on': '1', 'run': '1', 'wine': '1', 'wan': '1',
+    'wand': '1', 'want': '1', 'john': '1', 'juan': '1', 'hand': '1', 'an': '1', 'hun': '1', 'done': '1',
+    'none': '1', 'gone': '1', 'some': '1', 'son': '1', 'sun': '1',
+
+    # 2 variations - augmented list
+    'two': '2', 'to': '2', 'too': '2', 'do': '2', 'tu': '2', 'true': '2', 'tru': '2', 'due': '2', 'tools': '2',
+    'toe': '2', 'new': '2', 'blue': '2', 'who': '2', 'crew': '2', 'through': '2', 'tour': '2', 'dual': '2',
+    'duel': '2', 'cool': '2', 'tune': '2', 'dew': '2', 'shoe': '2', 'chew': '2', 'tell': '2',
+
+    # 3 variations - augmented list
+    'three': '3', 'tree': '3', 'free': '3', 'sri': '3', 'pre': '3', 'flee': '3',
+    'thirty': '3', 'string': '3', 'tricky': '3', 'cream': '3', 'tee': '3', 'real': '3', 'plea': '3',
+    'treat': '3', 'thread': '3', 'trend': '3', 'treaty': '3',
+
+    # 4 variations - augmented list
+    'four': '4', 'for': '4', 'far': '4', 'fore': '4', 'floor': '4', 'door': '4', 'more': '4', 'form': '4',
+    'ford': '4', 'fourth': '4', 'foreign': '4', 'bore': '4', 'foe': '4', 'fold': '4', 'fort': '4',
+    'forty': '4', 'fall': '4', 'fall': '4', 'foam': '4', 'fork': '4', 'or': '4',
+
+    # 5 variations - augmented list
+    'five': '5', 'phi': '5', 'hive': '5', 'fife': '5', 'fight': '5', 'file': '5', 'find': '5',
+    'fiver': '5', 'fiber': '5', 'fine': '5', 'fan': '5', 'phone': '5', 'knife': '5', 'life': '5',
+    'wife': '5', 'faith': '5', 'wifi': '5', 'vibe': '5', 'fifth': '5', 'alive': '5','favor':'5','favorite':'5',
+
+    # 6 variations - augmented list
+    'six': '6', 'sicks': '6', 'sticks': '6', 'sick': '6', 'sex': '6', 'sicks': '6',
+    'sic': '6', 'sax': '6', 'seeks': '6', 'sees': '6', 'sync': '6', 'fix': '6', 'bricks': '6',
+    'mix': '6', 'hits': '6', 'chicks': '6', 'styx': '6', 'sixty': '6', 'sake': '6',
+
+    # 7 variations - augmented list
+    'seven': '7', 'savin': '7', 'heaven': '7', 'evan': '7', 'kevin': '7', 'eleven': '7',
+    'several': '7', 'seventy': '7', 'seventh': '7', 'sven': '7', 'steven': '7', 'leaven': '7',
+    'devon': '7', 'stefan': '7', 'seven and': '7', 'seven in': '7', 'savvy': '7',
+
+    # 8 variations - augmented list
+    'eight': '8', 'ate': '8', 'hate': '8', 'late': '8', 'date': '8', 'rate': '8', 'gate': '8',
+    'aide': '8', 'ape': '8', 'eighty': '8', 'at': '8', 'hey': '8', 'fate': '8', 'wait': '8',
+    'great': '8', 'state': '8', 'trait': '8', 'weight': '8', 'mate': '8', 'bait': '8'
+}
+
+# Misheard chess terms
+CHESS_TERMS = {
+    'night': 'knight', 'knights': 'knight', 'knife': 'knight', 'knives': 'knight',
+    'pollen': 'pawn', 'porn': 'pawn', 'pond': 'pawn', 'bond': 'pawn',
+    'shop': 'bishop', 'fish': 'bishop', 'dish': 'bishop',
+    'brook': 'rook', 'roh': 'rook', 'rogue': 'rook', 'look': 'rook', 'took': 'rook',
+    'clean': 'queen', 'cream': 'queen', 'screen': 'queen',
+    'ring': 'king', 'ping': 'king',
+    'cattle': 'castle', 'castle': 'castle', 'cassell': 'castle',
+    'king side': 'kingside', 'queenside': 'queenside', 'queen side': 'queenside'
+}
+
+# General replacements: letters, ranks, chess words and whole coordinate phrases
+SPOKEN_REPLACEMENTS = {
+    'eh': 'a', 'ae': 'a', 'ay': 'a', 'ey': 'a', 'ei': 'a','yeah':'a','yay':'a','ye':'a',
+    'bee': 'b', 'be': 'b', 'bi': 'b', 'by': 'b', 'pee': 'b', 'pe': 'b',
+    'see': 'c', 'sea': 'c', 'si': 'c', 'cee': 'c',
+    'dee': 'd', 'dey': 'd', 'di': 'd', 'the': 'd',
+    'ee': 'e', 'ie': 'e', 'ea': 'e', 'yi': 'e', 'ii': 'e',
+    'ef': 'f', 'aff': 'f', 'eaf': 'f', 'eff': 'f', 'afe': 'f','yes':'f',
+    'gee': 'g', 'ji': 'g', 'jee': 'g', 'gi': 'g',
+    'aitch': 'h', 'etch': 'h', 'age': 'h', 'ach': 'h', 'each': 'h','hedge':'h','hetch':'h','heich':'h',
+    'a': 'a', 'b': 'b', 'c': 'c','seems':'c', 'd': 'd', 'e': 'e', 'f': 'f', 'g': 'g', 'h': 'h',
+    'en': 'n', 'an': 'n', 'in': 'n', 'end': 'n', 'and': 'n', 'yen': 'n','then':'n','jan':'n','jen':'n',
+    'are': 'r', 'our': 'r', 'or': 'r', 'arr': 'r', 'air': 'r',
+    'queue': 'q', 'cu': 'q', 'que': 'q', 'cue': 'q', 'kyu': 'q','huh':'q','you':'q',
+    'kay': 'k', 'ca': 'k', 'ka': 'k', 'key': 'k', 'cay': 'k',
+
+    # Enhanced number recognition
+    'one': '1', 'van': '1', 'von': '1', 'won': '1', 'fun': '1', 'on': '1', 'run': '1', 'wine': '1', 'wan': '1',
+    'two': '2', 'to': '2', 'too': '2', 'do': '2', 'tu': '2', 'true': '2', 'tru': '2', 'due': '2', 'tools': '2',
+    'three': '3', 'tree': '3','they':'3', 'free': '3', 'sri': '3', 'pre': '3', 'flee': '3',
+    'four': '4','thought':'4', 'for': '4', 'far': '4', 'fore': '4', 'floor': '4', 'door': '4', 'more': '4', 'form': '4',
+    'five': '5', 'phi': '5', 'hive': '5', 'fife': '5', 'fight': '5', 'file': '5', 'find': '5','faill':'5','fame':'5',
+    'six': '6', 'sicks': '6', 'sticks': '6', 'sick': '6', 'sex': '6',
+    'seven': '7', 'savin': '7', 'heaven': '7', 'evan': '7', 'kevin': '7', 'eleven': '7',
+    'eight': '8', 'ate': '8', 'hate': '8', 'late': '8', 'date': '8', 'rate': '8', 'gate': '8','aight':'8',
+
+    # Chess piece mappings (unchanged)
+    'pawn': 'pawn', 'porn': 'pawn', 'pond': 'pawn', 'bond': 'pawn',
+    'night': 'knight', 'knights': 'knight', 'knife': 'knight', 'knives': 'knight',
+    'bishop': 'bishop', 'shop': 'bishop', 'fish': 'bishop', 'dish': 'bishop',
+    'rook': 'rook', 'book': 'rook', 'brooke': 'rook', 'brook': 'rook', 'took': 'rook',
+    'queen': 'queen', 'clean': 'queen', 'cream': 'queen', 'screen': 'queen',
+    'king': 'king', 'ring': 'king', 'ping': 'king',
+    'capture': 'capture', 'captures': 'capture', 'takes': 'capture', 'take': 'capture',
+    'move': 'move', 'moves': 'move', 'moving': 'move',
+    'castle': 'castle', 'castles': 'castle', 'castling': 'castle', 'cassell': 'castle',
+    'castleside': 'castle kingside', 'castle side': 'castle kingside',
+    'kingside': 'kingside', 'king side': 'kingside', "king's side": 'kingside',
+    'queenside': 'queenside', 'queen side': 'queenside', "queen's side": 'queenside',
+    'short': 'kingside', 'short castle': 'castle kingside',
+    'long': 'queenside', 'long castle': 'castle queenside',
+    'promote': 'promote', 'promotion': 'promote',
+    'check': 'check',
+
+    # Special case coordinate mappings
+    'e2e4': 'e2 to e4',
+    'e two e four': 'e2 to e4',
+    'e 2 e 4': 'e2 to e4',
+    'e two to e four': 'e2 to e4',
+}
+
+# Letter-then-number pairs as heard with an Indian accent, e.g. "be tree" -> b3
+ACCENT_PATTERNS = {
+    # e row
+    r'e do': 'e2', r'e to': 'e2', r'e too': 'e2', r'e two': 'e2', r'e tu': 'e2',
+    r'e tree': 'e3', r'e three': 'e3', r'e free': 'e3',
+    r'e for': 'e4', r'e four': 'e4', r'e far': 'e4', r'e floor': 'e4',
+    r'e five': 'e5', r'e phi': 'e5',
+    r'e six': 'e6', r'e sicks': 'e6',
+    r'e seven': 'e7', r'e savin': 'e7',
+    r'e eight': 'e8', r'e ate': 'e8',
+
+    # a row
+    r'a do': 'a2', r'a to': 'a2', r'a too': 'a2', r'a two': 'a2', r'a tu': 'a2',
+    r'a tree': 'a3', r'a three': 'a3', r'a free': 'a3',
+    r'a for': 'a4', r'a four': 'a4', r'a far': 'a4',
+    r'a five': 'a5', r'a phi': 'a5',
+    r'a six': 'a6', r'a sicks': 'a6',
+    r'a seven': 'a7', r'a savin': 'a7',
+    r'a eight': 'a8', r'a ate': 'a8',
+
+    # b row
+    r'be do': 'b2', r'b do': 'b2', r'b to': 'b2', r'b too': 'b2', r'b two': 'b2',
+    r'be tree': 'b3', r'b tree': 'b3', r'b three': 'b3', r'b free': 'b3',
+    r'be for': 'b4', r'b for': 'b4', r'b four': 'b4', r'b far': 'b4',
+    r'be five': 'b5', r'b five': 'b5', r'b phi': 'b5',
+    r'be six': 'b6', r'b six': 'b6', r'b sicks': 'b6',
+    r'be seven': 'b7', r'b seven': 'b7', r'b savin': 'b7',
+    r'be eight': 'b8', r'b eight': 'b8', r'b ate': 'b8',
+
+    # c row
+    r'see do': 'c2', r'c do': 'c2', r'c to': 'c2', r'c too': 'c2', r'c two': 'c2',
+    r'see tree': 'c3', r'c tree': 'c3', r'c three': 'c3', r'c free': 'c3',
+    r'see for': 'c4', r'c for': 'c4', r'c four': 'c4', r'c far': 'c4',
+    r'see five': 'c5', r'c five': 'c5', r'c phi': 'c5',
+    r'see six': 'c6', r'c six': 'c6', r'c sicks': 'c6',
+    r'see seven': 'c7', r'c seven': 'c7', r'c savin': 'c7',
+    r'see eight': 'c8', r'c eight': 'c8', r'c ate': 'c8',
+
+    # d row
+    r'de do': 'd2', r'd do': 'd2', r'd to': 'd2', r'd too': 'd2', r'd two': 'd2',
+    r'de tree': 'd3', r'd tree': 'd3', r'd three': 'd3', r'd free': 'd3',
+    r'de for': 'd4', r'd for': 'd4', r'd four': 'd4', r'd far': 'd4',
+    r'de five': 'd5', r'd five': 'd5', r'd phi': 'd5',
+    r'de six': 'd6', r'd six': 'd6', r'd sicks': 'd6',
+    r'de seven': 'd7', r'd seven': 'd7', r'd savin': 'd7',
+    r'de eight': 'd8', r'd eight': 'd8', r'd ate': 'd8',
+
+    # g row
+    r'ge do': 'g2', r'g do': 'g2', r'g to': 'g2', r'g too': 'g2', r'g two': 'g2',
+    r'ge tree': 'g3', r'g tree': 'g3', r'g three': 'g3', r'g free': 'g3',
+    r'ge for': 'g4', r'g for': 'g4', r'g four': 'g4', r'g far': 'g4',
+    r'ge five': 'g5', r'g five': 'g5', r'g phi': 'g5',
+    r'ge six': 'g6', r'g six': 'g6', r'g sicks': 'g6',
+    r'ge seven': 'g7', r'g seven': 'g7', r'g savin': 'g7',
+    r'ge eight': 'g8', r'g eight': 'g8', r'g ate': 'g8',
+
+    # h row
+    r'h do': 'h2', r'h to': 'h2', r'h too': 'h2', r'h two': 'h2',
+    r'h tree': 'h3', r'h three': 'h3', r'h free': 'h3',
+    r'h for': 'h4', r'h four': 'h4', r'h far': 'h4',
+    r'h five': 'h5', r'h phi': 'h5',
+    r'h six': 'h6', r'h sicks': 'h6',
+    r'h seven': 'h7', r'h savin': 'h7',
+    r'h eight': 'h8', r'h ate': 'h8',
+
+    # f row
+    r'f do': 'f2', r'f to': 'f2', r'f too': 'f2', r'f two': 'f2',
+    r'f tree': 'f3', r'f three': 'f3', r'f free': 'f3',
+    r'f for': 'f4', r'f four': 'f4', r'f far': 'f4',
+    r'f five': 'f5', r'f phi': 'f5',
+    r'f six': 'f6', r'f sicks': 'f6',
+    r'f seven': 'f7', r'f savin': 'f7',
+    r'f eight': 'f8', r'f ate': 'f8',
+}
+
+FILE_LETTERS = frozenset('abcdefgh')
+RANK_DIGITS = frozenset('12345678')
+SQUARE_NAMES = frozenset(chess.SQUARE_NAMES)
+
+def compile_lexicon():
+    """Merge the spoken-form tables into one word lexicon and one phrase table.
+    
+    Every word gets up to three readings: a chess word (piece, castle, side, ...),
+    a letter (file or piece letter) and a rank digit. When tables disagree on the same
+    reading, the first table below wins:
+      words:   CHESS_TERMS, SPOKEN_REPLACEMENTS
+      letters: SPOKEN_REPLACEMENTS, ACCENT_PATTERNS (first word), LETTER_SOUNDS
+      ranks:   NUMBER_SOUNDS, SPOKEN_REPLACEMENTS, ACCENT_PATTERNS (second word)
+    Which reading is used is decided by context in normalize_utterance().
+    Multi-word keys become phrases, first table wins: SPOKEN_REPLACEMENTS, NUMBER_SOUNDS, CHESS_TERMS.
+    """
+    words, letters, ranks, phrases = {}, {}, {}, {}
+    
+    def add(sound, value):
+        if ' ' in sound:
+            phrases.setdefault(tuple(sound.split()), value)
+        elif value in FILE_LETTERS or value in ('n', 'r', 'q', 'k'):
+            letters.setdefault(sound, value)
+        elif value in RANK_DIGITS:
+            ranks.setdefault(sound, value)
         else:
-            # Try to match partial words for numbers (more aggressive matching)
-            replaced = False
-            for sound, number in number_map.items():
-                # For shorter words, require more exact matches
-                if len(word) <= 3:
-                    if word == sound:
-                        result_words.append(number)
-                        replaced = True
-                        if DEBUG:
-                            print(f"Number match: '{word}' -> '{number}'")
-                        break
-                # For longer words, allow partial matching with confidence
-                elif len(sound) >= 3 and sound in word and len(word) <= len(sound) + 2:
-                    result_words.append(number)
-                    replaced = True
-                    if DEBUG:
-                        print(f"Partial number match: '{word}' -> '{number}'")
-                    break
-            
-            if not replaced:
-                result_words.append(word)
-    
-    processed_text = ' '.join(result_words)
+            words.setdefault(sound, value)
+    
+    for sound, value in CHESS_TERMS.items():
+        add(sound, value)
+    for sound, value in SPOKEN_REPLACEMENTS.items():
+        add(sound, value)
+    for sound, value in NUMBER_SOUNDS.items():
+        add(sound, value)
+    for pattern, square in ACCENT_PATTERNS.items():
+        letter_sound, rank_sound = pattern.split()
+        letters.setdefault(letter_sound, square[0])
+        ranks.setdefault(rank_sound, square[1])
+    for sound, value in LETTER_SOUNDS.items():
+        letters.setdefault(sound, value)
+    
+    # "to" is the connector in "e2 to e4"; it only reads as 2 straight after a file letter
+    words['to'] = 'to'
+    for digit in RANK_DIGITS:
+        ranks[digit] = digit
+    
+    lexicon = {}
+    for sound in set(words) | set(letters) | set(ranks):
+        lexicon[sound] = (words.get(sound), letters.get(sound), ranks.get(sound))
+    return lexicon, phrases
+
+LEXICON, PHRASES = compile_lexicon()
+PHRASE_STARTS = frozenset(phrase[0] for phrase in PHRASES)
+PHRASE_MAX_WORDS = max(len(phrase) for phrase in PHRASES)
+
+NON_LETTERS = re.compile('[^a-z]')
+# Leading letter pairs that sound as one letter, and the lone "x" that sounds as "s"
+SILENT_PREFIXES = ('kn', 'gn', 'pn', 'wr', 'ps', 'wh', 'x')
+
+def phonetic_key(word):
+    """Simplified Metaphone key: the consonant skeleton that sound-alike spellings share.
+    
+    "knight", "nite" and "night" all give "NT"; "sevan" and "seven" give "SFN".
+    A leading vowel is kept as "A" so "eight" ("AT") and "ate" stay distinct from "to" ("T").
+    """
+    word = NON_LETTERS.sub('', word.lower())
+    if word.startswith(SILENT_PREFIXES):
+        for prefix, replacement in (('kn', 'n'), ('gn', 'n'), ('pn', 'n'), ('wr', 'r'), ('ps', 's'), ('wh', 'w'), ('x', 's')):
+            if word.startswith(prefix):
+                word = replacement + word[len(prefix):]
+                break
+    vowels = 'aeiou'
+    key = []
+    i = 0
+    while i < len(word):
+        ch = word[i]
+        nxt = word[i + 1] if i + 1 < len(word) else ''
+        after = word[i + 2] if i + 2 < len(word) else ''
+        code = ''
+        if ch in vowels:
+            code = 'A' if i == 0 else ''
+        elif ch == 'b':
+            code = '' if i == len(word) - 1 and word[i - 1:i] == 'm' else 'B'
+        elif ch == 'c':
+            if nxt == 'h':
+                code, i = 'X', i + 1
+            else:
+                code = 'S' if nxt in ('e', 'i', 'y') else 'K'
+        elif ch == 'd':
+            code = 'J' if nxt == 'g' and after in ('e', 'i', 'y') else 'T'
+        elif ch == 'g':
+            if nxt == 'h' and not (after and after in vowels + 'y'):
+                i += 1  # silent "gh" as in "night", "eight"
+            elif nxt in ('e', 'i', 'y'):
+                code = 'J'
+            else:
+                code = 'K'
+        elif ch == 'h':
+            code = 'H' if nxt and nxt in vowels and word[i - 1:i] not in ('c', 's', 'p', 't', 'g') else ''
+        elif ch == 'k':
+            code = '' if word[i - 1:i] == 'c' else 'K'
+        elif ch == 'p':
+            if nxt == 'h':
+                code, i = 'F', i + 1
+            else:
+                code = 'P'
+        elif ch == 'q':
+            code = 'K'
+        elif ch == 's':
+            if nxt == 'h':
+                code, i = 'X', i + 1
+            else:
+                code = 'S'
+        elif ch == 't':
+            if nxt == 'h':
+                code, i = '0', i + 1
+            else:
+                code = 'T'
+        elif ch == 'v':
+            code = 'F'
+        elif ch in ('w', 'y'):
+            code = ch.upper() if nxt and nxt in vowels else ''
+        elif ch == 'x':
+            code = 'KS'
+        elif ch == 'z':
+            code = 'S'
+        else:
+            code = ch.upper()
+        for symbol in code:
+            if not key or key[-1] != symbol:
+                key.append(symbol)
+        i += 1
+    return ''.join(key)
+
+def bit_pattern(word):
+    """Bit mask of the positions of each character in word, for edit_distance()"""
+    pattern = {}
+    for i, ch in enumerate(word):
+        pattern[ch] = pattern.get(ch, 0) | 1 << i
+    return pattern
+
+def edit_distance(a, b, limit=None, pattern=None):
+    """Levenshtein distance between two short strings, bit-parallel (Myers/Hyyro).
+    
+    Each column of the distance table is kept as bit vectors of +1/-1 steps, so a character
+    of a costs a handful of integer operations whatever the length of b. With a limit, any
+    distance above it comes back as limit + 1, decided from the lengths alone or as soon as
+    the characters left cannot bring the distance back within it. pattern, if given, is
+    bit_pattern(b), for comparing many strings against one b.
+    """
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not b:
+        return len(a) if limit is None else min(len(a), limit + 1)
+    matches = pattern if pattern is not None else bit_pattern(b)
+    mask = (1 << len(b)) - 1
+    last = 1 << (len(b) - 1)
+    plus, minus = mask, 0
+    distance = len(b)
+    remaining = len(a)
+    for ch in a:
+        eq = matches.get(ch, 0)
+        vertical = eq | minus
+        horizontal = (((eq & plus) + plus) ^ plus) | eq
+        plus_h = minus | ~(horizontal | plus)
+        minus_h = plus & horizontal
+        if plus_h & last:
+            distance += 1
+        elif minus_h & last:
+            distance -= 1
+        remaining -= 1
+        if limit is not None and distance - remaining > limit:
+            return limit + 1
+        plus_h = (plus_h << 1) | 1
+        minus_h <<= 1
+        plus = (minus_h | ~(vertical | plus_h)) & mask
+        minus = plus_h & vertical & mask
+    if limit is not None:
+        return min(distance, limit + 1)
+    return distance
+
+class BKTree:
+    """Burkhard-Keller tree over phonetic keys.
+    
+    Each node is (key, words, children, order): the words sharing the key and the child
+    nodes by their distance to it. By the triangle inequality a query within budget d only
+    has to descend into children at distances [dist - d, dist + d].
+    """
+    def __init__(self):
+        self.root = None
+        self.size = 0
+    
+    def add(self, key, word):
+        node = self.root
+        while node is not None:
+            distance = edit_distance(key, node[0])
+            if distance == 0:
+                if word not in node[1]:
+                    node[1].append(word)
+                return
+            if distance not in node[2]:
+                break
+            node = node[2][distance]
+        new_node = (key, [word], {}, self.size)
+        self.size += 1
+        if node is None:
+            self.root = new_node
+        else:
+            node[2][distance] = new_node
     
-    # Apply regex patterns for coordinate detection
-    coord_patterns = [
-        # Join letter-number combinations (with spaces or without)
-        (r'\b([a-h])\s+([1-8])\b', r'\1\2'),
+    def nearest(self, key, budget):
+        """Return (distance, words) for the closest keys within budget, or None.
         
-        # Handle letter + to + number
-        (r'\b([a-h])\s+to\s+([1-8])\b', r'\1\2'),
+        words holds the words of every key at that distance, in the order they were added.
+        """
+        best_distance, best_nodes = None, []
+        pattern = bit_pattern(key)
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            # Past budget plus the longest edge neither the node nor any child can qualify
+            reach = budget + max(node[2], default=0)
+            distance = edit_distance(node[0], key, reach, pattern)
+            if distance > reach:
+                continue
+            if distance <= budget:
+                if best_distance is None or distance < best_distance:
+                    best_distance, best_nodes = distance, [node]
+                elif distance == best_distance:
+                    best_nodes.append(node)
+                budget = distance
+            for edge, child in node[2].items():
+                if distance - budget <= edge <= distance + budget:
+                    stack.append(child)
+        if best_distance is None:
+            return None
+        best_nodes.sort(key=lambda node: node[3])
+        return best_distance, [word for node in best_nodes for word in node[1]]
+
+# Vocabulary the fuzzy fallback can snap an out-of-vocabulary word onto: the spoken piece
+# names, castling words and rank words themselves. Their sound-alikes in the lexicon are
+# left out; snapping onto "wait" (8) or "sixty" (6) would stack one guess on another.
+FUZZY_VOCABULARY = (
+    ['pawn', 'knight', 'bishop', 'rook', 'queen', 'king', 'castle', 'kingside', 'queenside']
+    + ['one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight']
+)
+FUZZY_INDEX = BKTree()
+FUZZY_KEYS = {}  # key -> vocabulary words with it, for exact matches
+for fuzzy_word in FUZZY_VOCABULARY:
+    if fuzzy_word in LEXICON:
+        FUZZY_INDEX.add(phonetic_key(fuzzy_word), fuzzy_word)
+        same_key = FUZZY_KEYS.setdefault(phonetic_key(fuzzy_word), [])
+        if fuzzy_word not in same_key:
+            same_key.append(fuzzy_word)
+del fuzzy_word
+fuzzy_cache = LRUCache(4096)
+# Endings stripped before an exact key match: plurals, ordinals ("eighth") and "castling"
+FUZZY_SUFFIXES = ('s', 'es', 'h', 'ing')
+
+def spelling_edits(candidate):
+    """Spelling edits allowed between a word and the vocabulary word it snaps onto: one per
+    three letters, so "sevan" -> seven and "castel" -> castle but not "there" -> three"""
+    return max(1, len(candidate) // 3)
+
+def closest_spelling(spelling, candidates):
+    """The candidate spelled most like spelling, or None when none is within its spelling_edits()
+    or the closest ones read differently.
+    
+    Keys drop vowels, so "tree" (3), "true" (2) and "door" (4) share one; the spelling decides,
+    and it rules out words that only share a consonant skeleton, like "what" and "wait".
+    """
+    distances = {}
+    for candidate in candidates:
+        limit = spelling_edits(candidate)
+        distance = edit_distance(spelling, candidate, limit)
+        if distance <= limit:
+            distances[candidate] = distance
+    if not distances:
+        return None
+    best = min(distances.values())
+    closest = [candidate for candidate, distance in distances.items() if distance == best]
+    if len({LEXICON[candidate] for candidate in closest}) > 1:
+        return None
+    return closest[0]
+
+def fuzzy_lexicon_word(word):
+    """Closest-sounding lexicon word for an out-of-vocabulary word, or None.
+    
+    A stem without one of FUZZY_SUFFIXES that is in the lexicon is taken as is. Next comes a
+    word or stem whose key is indexed. Otherwise keys of 4-6 sounds may be one edit away
+    and longer keys two; shorter keys are too easy to confuse. Either way the spelling must
+    be close as well (closest_spelling()), so "what" does not become "wait" nor "xylophone"
+    "seven". Results are memoized since the recognizer repeats its misspellings.
+    """
+    match = fuzzy_cache.get(word)
+    if match is None:
+        stems = [word[:-len(suffix)] for suffix in FUZZY_SUFFIXES
+                 if word.endswith(suffix) and len(word) - len(suffix) >= 3]
+        match = next((stem for stem in stems if stem in LEXICON), None)
+        key = phonetic_key(word)
+        for spelling in [word] + stems:
+            if match:
+                break
+            candidates = FUZZY_KEYS.get(key if spelling is word else phonetic_key(spelling))
+            if candidates:
+                match = closest_spelling(spelling, candidates)
+        budget = (len(key) - 1) // 3
+        if not match and budget > 0:
+            found = FUZZY_INDEX.nearest(key, budget)
+            match = closest_spelling(word, found[1]) if found else None
+        fuzzy_cache.put(word, match or '')
+    return match or None
+
+def append_token(tokens, token):
+    """Append a normalized token, joining a rank onto a preceding file letter and 'to' between squares"""
+    previous = tokens[-1] if tokens else ''
+    if token in RANK_DIGITS and previous in FILE_LETTERS:
+        tokens.pop()
+        token = previous + token
+        previous = tokens[-1] if tokens else ''
+    if token in SQUARE_NAMES and previous in SQUARE_NAMES:
+        tokens.append('to')
+    tokens.append(token)
+
+def normalize_utterance(text):
+    """Normalize a recognized utterance in one left-to-right pass over its words.
+    
+    Phrases are matched longest first. A word that can be read as a rank is read as one
+    right after a bare file letter ("e for" -> e4); otherwise a chess word reading wins
+    over a letter reading, which wins over a rank reading.
+    """
+    words = text.lower().split()
+    tokens = []
+    i = 0
+    while i < len(words):
+        word = words[i]
         
-        # Handle already numeric cases
-        (r'\b([a-h][1-8])\s+to\s+([a-h][1-8])\b', r'\1 to \2'),
-    ]
-    
-    for pattern, replacement in coord_patterns:
-        try:
-            processed_text = re.sub(pattern, replacement, processed_text)
-        except re.error as e:
+        if word in PHRASE_STARTS:
+            matched = False
+            for length in range(min(PHRASE_MAX_WORDS, len(words) - i), 1, -1):
+                replacement = PHRASES.get(tuple(words[i:i + length]))
+                if replacement is not None:
+                    for token in replacement.split():
+                        append_token(tokens, token)
+                    i += length
+                    matched = True
+                    break
+            if matched:
+                continue
+        
+        readings = LEXICON.get(word)
+        if readings:
+            chess_word, letter, rank = readings
+            if rank and tokens and tokens[-1] in FILE_LETTERS:
+                replacement = rank
+            else:
+                replacement = chess_word or letter or rank
+            for token in replacement.split():
+                append_token(tokens, token)
+        elif len(word) == 4 and word[:2] in SQUARE_NAMES and word[2:] in SQUARE_NAMES:
+            # "e2e4" style coordinate pairs
+            append_token(tokens, word[:2])
+            append_token(tokens, word[2:])
+        elif len(word) > 3 and word.isalpha() and fuzzy_lexicon_word(word):
+            match = fuzzy_lexicon_word(word)
             if DEBUG:
-                print(f"Regex error: {e}, Pattern: '{pattern}', Replacement: '{replacement}', Text: '{processed_text}'")
-    
-    # Add enhanced patterns for chess notation
-    chess_terms = {
-        'night': 'knight', 'knights': 'knight', 'knife': 'knight', 'knives': 'knight',
-        'pollen': 'pawn', 'porn': 'pawn', 'pond': 'pawn', 'bond': 'pawn',
-        'shop': 'bishop', 'fish': 'bishop', 'dish': 'bishop',
-        'brook': 'rook', 'roh': 'rook', 'rogue': 'rook', 'look': 'rook', 'took': 'rook',
-        'clean': 'queen', 'cream': 'queen', 'screen': 'queen',
-        'ring': 'king', 'ping': 'king',
-        'cattle': 'castle', 'castle': 'castle', 'cassell': 'castle', 
-        'king side': 'kingside', 'queenside': 'queenside', 'queen side': 'queenside'
-    }
+                tracing.log('debug', 'fuzzy match', word=word, match=match)
+            words[i] = match
+            continue
+        else:
+            append_token(tokens, word)
+        i += 1
     
-    for wrong, right in chess_terms.items():
-        processed_text = re.sub(r'\b' + wrong + r'\b', right, processed_text)
+    return ' '.join(tokens)
+
+# Players repeat their phrasings, so normalized text is kept per raw utterance
+normalization_cache = LRUCache(1024)
+
+def cached_normalize(text):
+    normalized = normalization_cache.get(text)
+    if normalized is None:
+        normalized = normalize_utterance(text)
+        normalization_cache.put(text, normalized)
+    return normalized
+
+def preprocess_speech_input(text):
+    processed_text = cached_normalize(text)
     
     if DEBUG:
-        print(f"After preprocessing: '{processed_text}'")
+        tracing.log('debug', 'preprocess', text=text, processed=processed_text)
     
     return processed_text
-# Enhanced parse_command function with improved move detection
-# Enhance the parse_command function to recognize standard chess notation
-# Improved normalize_text function with better number handling
-# Enhanced parse_command function with improved piece recognition
-def parse_command(command):
-    global status_message
-    
-    if command.startswith("Partial:"):
-        return None
-    
-    normalized = normalize_text(command)
+
+class MoveIndex:
+    """Legal moves of one position, grouped by every way a spoken command can name them"""
+    
+    def __init__(self, position):
+        self.moves = list(position.legal_moves)
+        self.by_destination = {}
+        self.by_piece_destination = {}
+        self.by_from_square = {}
+        self.by_san = {}
+        self.by_uci = {}
+        self.castling = {}
+        # Grammar phrases from spoken_move_phrases() and the moves they name
+        self.by_phrase = {}
+        self.by_normalized_phrase = {}
+        
+        pieces = []
+        for move in self.moves:
+            piece_type = position.piece_type_at(move.from_square)
+            pieces.append(piece_type)
+            self.by_destination.setdefault(move.to_square, []).append(move)
+            self.by_piece_destination.setdefault((piece_type, move.to_square), []).append(move)
+            self.by_from_square.setdefault(move.from_square, []).append(move)
+            self.by_uci[move.uci()] = move
+            if move.promotion == chess.QUEEN:
+                # Promotion defaults to a queen when no piece is named
+                self.by_uci[move.uci()[:4]] = move
+            if piece_type == chess.KING and position.is_castling(move):
+                self.castling['kingside' if position.is_kingside_castling(move) else 'queenside'] = move
+        
+        for move, piece_type in zip(self.moves, pieces):
+            self.by_san[self.stripped_san(move, piece_type)] = move
+            for phrase, normalized in move_phrases(position, move, piece_type):
+                moves = self.by_phrase.get(phrase)
+                if moves is None:
+                    moves = self.by_phrase[phrase] = []
+                    self.by_normalized_phrase.setdefault(normalized, moves)
+                moves.append(move)
+        if self.castling:
+            # A bare "castle" means kingside, or the only side left
+            moves = self.by_phrase["castle"] = [self.castling.get('kingside') or self.castling['queenside']]
+            self.by_normalized_phrase.setdefault(normalized_phrase("castle"), moves)
+    
+    def stripped_san(self, move, piece_type):
+        """SAN in lower case without capture, check and mate marks, built from the groups above
+        so no move has to be pushed to test for check"""
+        if piece_type == chess.KING and move in self.castling.values():
+            return 'o-o' if move == self.castling.get('kingside') else 'o-o-o'
+        
+        destination = chess.square_name(move.to_square)
+        if piece_type == chess.PAWN:
+            san = destination
+            if chess.square_file(move.from_square) != chess.square_file(move.to_square):
+                san = chess.FILE_NAMES[chess.square_file(move.from_square)] + san
+            if move.promotion:
+                san += '=' + chess.piece_symbol(move.promotion)
+            return san
+        
+        # Disambiguate by file, then rank, then both, like python-chess does
+        rivals = [other.from_square for other in self.by_piece_destination[(piece_type, move.to_square)]
+                  if other.from_square != move.from_square]
+        disambiguation = ''
+        if rivals:
+            same_file = any(chess.square_file(square) == chess.square_file(move.from_square) for square in rivals)
+            same_rank = any(chess.square_rank(square) == chess.square_rank(move.from_square) for square in rivals)
+            if not same_file:
+                disambiguation = chess.FILE_NAMES[chess.square_file(move.from_square)]
+            elif not same_rank:
+                disambiguation = chess.RANK_NAMES[chess.square_rank(move.from_square)]
+            else:
+                disambiguation = chess.square_name(move.from_square)
+        return chess.piece_symbol(piece_type) + disambiguation + destination
+
+move_index_cache = LRUCache(64)
+# Normalized grammar phrases; the same few thousand phrases recur from position to position
+phrase_cache = LRUCache(8192)
+# Grammar phrases of a move by (piece, from-square, to-square, capture). Most of a side's moves
+# are unchanged by the moves in between, so after a move the index rebuilds only the new ones
+move_phrase_cache = LRUCache(8192)
+
+def normalized_phrase(phrase):
+    normalized = phrase_cache.get(phrase)
+    if normalized is None:
+        normalized = normalize_utterance(phrase)
+        phrase_cache.put(phrase, normalized)
+    return normalized
+
+def move_phrases(position, move, piece_type):
+    """(phrase, normalized phrase) pairs of spoken_move_phrases(), shared by every position
+    where the same piece makes the same move"""
+    key = (piece_type, move.from_square, move.to_square, position.is_capture(move))
+    phrases = move_phrase_cache.get(key)
+    if phrases is None:
+        phrases = tuple((phrase, normalized_phrase(phrase)) for phrase in spoken_move_phrases(position, move).values())
+        move_phrase_cache.put(key, phrases)
+    return phrases
+
+
+def move_index(position=None, key=None):
+    """Legal-move index for a position, built once and looked up by position key (hashed here
+    unless the caller already has it)"""
+    if position is None:
+        position = board
+    if key is None:
+        key = position_key(position)
+    index = move_index_cache.get(key)
+    if index is None:
+        index = MoveIndex(position)
+        move_index_cache.put(key, index)
+    return index
+
+# Spoken forms of moves, used for the recognizer grammar and for parser benchmarks
+SPOKEN_PIECES = {
+    chess.PAWN: 'pawn', chess.KNIGHT: 'knight', chess.BISHOP: 'bishop',
+    chess.ROOK: 'rook', chess.QUEEN: 'queen', chess.KING: 'king'
+}
+SPOKEN_RANKS = ['one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight']
+
+def spoken_square(square):
+    return f"{chess.FILE_NAMES[chess.square_file(square)]} {SPOKEN_RANKS[chess.square_rank(square)]}"
+
+def spoken_move_phrases(position, move):
+    """Ways a player may say a legal move, keyed by phrase template"""
+    if position.is_castling(move):
+        if position.is_kingside_castling(move):
+            return {'castle': "castle kingside", 'castle_short_long': "short castle"}
+        return {'castle': "castle queenside", 'castle_short_long': "long castle"}
+    
+    piece_type = position.piece_type_at(move.from_square)
+    destination = spoken_square(move.to_square)
+    takes = " takes" if position.is_capture(move) else ""
+    if piece_type == chess.PAWN:
+        if takes:
+            san = f"{chess.FILE_NAMES[chess.square_file(move.from_square)]}{takes} {destination}"
+        else:
+            san = destination
+    else:
+        san = f"{SPOKEN_PIECES[piece_type]}{takes} {destination}"
+    return {
+        'san': san,
+        'piece_to': f"{SPOKEN_PIECES[piece_type]} to {destination}",
+        'coordinates': f"{spoken_square(move.from_square)} to {destination}",
+    }
+
+grammar_cache = LRUCache(64)
+
+def move_grammar(position=None):
+    """Vosk grammar (JSON phrase list) covering every legal move of a position"""
+    if position is None:
+        position = board
+    key = position_key(position)
+    grammar = grammar_cache.get(key)
+    if grammar is None:
+        grammar = build_grammar(move_index(position))
+        grammar_cache.put(key, grammar)
+    return grammar
+
+def build_grammar(index):
+    return json.dumps(sorted(index.by_phrase) + ["[unk]"])
+
+# Grammar the listener thread should decode with; replaced after every confirmed move
+recognizer_grammar = None
+
+def update_recognizer_grammar():
+    """Hand the speech process the new position's grammar and have it index the position"""
+    global recognizer_grammar
+    
+    if speech_process is not None:
+        speech_process.prepare(board)
+    if USE_GRAMMAR:
+        recognizer_grammar = move_grammar()
+        if speech_process is not None:
+            speech_process.set_grammar(recognizer_grammar)
+
+# Piece words and abbreviations looked for in a normalized command
+PIECE_TYPES = {
+    'knight': chess.KNIGHT,
+    'bishop': chess.BISHOP,
+    'rook': chess.ROOK,
+    'queen': chess.QUEEN,
+    'king': chess.KING,
+    'n': chess.KNIGHT,  # Also handle abbreviations
+    'b': chess.BISHOP,
+    'r': chess.ROOK,
+    'q': chess.QUEEN,
+    'k': chess.KING
+}
+
+# Resolved commands by (position key, normalized text); a new position simply misses
+parse_cache = LRUCache(1024)
+
+def command_candidates(normalized, position=None):
+    """Moves a normalized command can mean, from the first parsing step that matches, best first.
+    
+    Returns (moves, reason); moves is an empty tuple when nothing matched. Has no side effects,
+    so it is safe to call on partial results from the listener thread.
+    """
+    if position is None:
+        position = board
+    position_hash = position_key(position)
+    key = (position_hash, normalized)
+    result = parse_cache.get(key)
+    if result is None:
+        moves, reason = resolve_command(normalized, position, position_hash)
+        result = (tuple(moves), reason)
+        parse_cache.put(key, result)
+    return result
+
+def resolve_command(normalized, position, key=None):
+    """Run the parsing steps for command_candidates() without the cache"""
+    index = move_index(position, key)
     
-    if DEBUG:
-        coords = re.findall(r'[a-h][1-8]', normalized)
-        if coords:
-            print(f"Found chess coordinates in normalized text: {coords}")
+    # --- 0. Phrases of the recognizer grammar name their moves exactly ---
+    moves = index.by_normalized_phrase.get(normalized) if MATCH_GRAMMAR_PHRASES else None
+    if moves:
+        return moves, f"Grammar phrase matched: {normalized}"
     
     # --- 1. Check for castling first ---
     if "castle" in normalized:
         if "kingside" in normalized or "king side" in normalized or "short" in normalized or "00" in normalized:
-            for move in board.legal_moves:
-                if board.is_kingside_castling(move):
-                    if DEBUG:
-                        print("Kingside castling detected")
-                    return move
+            side = 'kingside'
         elif "queenside" in normalized or "queen side" in normalized or "long" in normalized or "000" in normalized:
-            for move in board.legal_moves:
-                if board.is_queenside_castling(move):
-                    if DEBUG:
-                        print("Queenside castling detected")
-                    return move
+            side = 'queenside'
         else:
             # Default to kingside if unclear
-            for move in board.legal_moves:
-                if board.is_kingside_castling(move):
-                    if DEBUG:
-                        print("Defaulted to kingside castling")
-                    return move
+            side = 'kingside'
+        move = index.castling.get(side)
+        if move:
+            return [move], f"{side.title()} castling detected"
     
     # --- 2. Check for explicit piece mentions ---
     # This new section looks for piece mentions like "knight", "bishop", etc.
-    piece_types = {
-        'knight': chess.KNIGHT,
-        'bishop': chess.BISHOP,
-        'rook': chess.ROOK,
-        'queen': chess.QUEEN,
-        'king': chess.KING,
-        'n': chess.KNIGHT,  # Also handle abbreviations
-        'b': chess.BISHOP,
-        'r': chess.ROOK,
-        'q': chess.QUEEN,
-        'k': chess.KING
-    }
-    
-    for piece_name, piece_type in piece_types.items():
+    for piece_name, piece_type in PIECE_TYPES.items():
         if piece_name in normalized:
             # Look for a destination coordinate
             coords = re.findall(r'[a-h][1-8]', normalized)
             if coords:
                 dest = coords[-1]  # Use the last coordinate as destination
-                for move in board.legal_moves:
-                    if (chess.square_name(move.to_square) == dest and 
-                        board.piece_at(move.from_square) and 
-                        board.piece_at(move.from_square).piece_type == piece_type):
-                        if DEBUG:
-                            print(f"{piece_name.title()} move detected to {dest}")
-                        return move
+                moves = index.by_piece_destination.get((piece_type, chess.parse_square(dest)))
+                if moves:
+                    return moves, f"{piece_name.title()} move detected to {dest}"
             break  # If we found a piece mention but no valid move, don't continue to pawn moves
     
     # --- 3. Detect knight moves like "n f3" (this is now redundant but kept for safety) ---
     knight_pattern = re.search(r'\bn\s*([a-h][1-8])\b', normalized)
     if knight_pattern:
         dest = knight_pattern.group(1)
-        for move in board.legal_moves:
-            if (chess.square_name(move.to_square) == dest and 
-                board.piece_at(move.from_square) and 
-                board.piece_at(move.from_square).piece_type == chess.KNIGHT):
-                if DEBUG:
-                    print(f"Knight move detected: N{dest}")
-                return move
+        moves = index.by_piece_destination.get((chess.KNIGHT, chess.parse_square(dest)))
+        if moves:
+            return moves, f"Knight move detected: N{dest}"
 
     # --- 4. Try full SAN matching (piece moves and captures) ---
     san_pattern = re.search(r'([NBRQK])?([a-h][1-8])', normalized)
     if san_pattern:
         piece_letter, destination = san_pattern.groups()
         if destination:
-            for move in board.legal_moves:
-                move_san = board.san(move)
-                stripped_san = move_san.replace("x", "").replace("+", "").replace("#", "").lower()
-                
-                # Build what user probably meant
-                user_san_guess = ''
-                if piece_letter:
-                    user_san_guess += piece_letter.lower()
-                user_san_guess += destination.lower()
-
-                if user_san_guess == stripped_san:
-                    if DEBUG:
-                        print(f"Matched SAN: User said '{user_san_guess}', matched '{move_san}'")
-                    return move
+            # Build what user probably meant
+            user_san_guess = ''
+            if piece_letter:
+                user_san_guess += piece_letter.lower()
+            user_san_guess += destination.lower()
+            
+            move = index.by_san.get(user_san_guess)
+            if move:
+                return [move], f"Matched SAN: User said '{user_san_guess}'"
 
     # --- 5. Check for coordinate pair "e2 to e4" or "e2e4" ---
     coord_pair = re.search(r'([a-h][1-8])\s*to\s*([a-h][1-8])', normalized)
     if coord_pair:
         from_sq, to_sq = coord_pair.groups()
-        move_uci = f"{from_sq}{to_sq}"
-        try:
-            move = chess.Move.from_uci(move_uci)
-            if move in board.legal_moves:
-                if DEBUG:
-                    print(f"Move by coordinates: {from_sq} to {to_sq}")
-                return move
-        except ValueError:
-            pass
+        move = index.by_uci.get(f"{from_sq}{to_sq}")
+        if move:
+            return [move], f"Move by coordinates: {from_sq} to {to_sq}"
 
     # --- 6. Single square move (pawn usually) ---
     # Only process this if no piece was explicitly mentioned above
-    if not any(piece in normalized for piece in piece_types.keys()):
+    if not any(piece in normalized for piece in PIECE_TYPES.keys()):
         single_square = re.search(r'\b([a-h][1-8])\b', normalized)
         if single_square:
             dest = single_square.group(1)
-            possible_moves = []
-            for move in board.legal_moves:
-                if chess.square_name(move.to_square) == dest:
-                    possible_moves.append(move)
-
+            possible_moves = index.by_destination.get(chess.parse_square(dest))
             if possible_moves:
                 # Prefer pawn moves if available
-                for move in possible_moves:
-                    if board.piece_at(move.from_square) and board.piece_at(move.from_square).piece_type == chess.PAWN:
-                        if DEBUG:
-                            print(f"Single square pawn move to {dest}")
-                        return move
+                pawn_moves = [move for move in possible_moves if position.piece_type_at(move.from_square) == chess.PAWN]
+                if pawn_moves:
+                    return pawn_moves, f"Single square pawn move to {dest}"
                 # Else just pick the first matching move
-                if DEBUG:
-                    print(f"Single square move to {dest} (non-pawn)")
-                return possible_moves[0]
+                return possible_moves, f"Single square move to {dest} (non-pawn)"
+    
+    return [], None
+
+# Enhanced parse_command function with improved piece recognition
+def parse_command(command, position=None):
+    
+    if command.startswith("Partial:"):
+        return None
+    if position is None:
+        position = board
+    
+    normalized = normalize_text(command)
+    
+    moves, reason = command_candidates(normalized, position)
+    tracer.mark('parse')
+    if moves:
+        if DEBUG:
+            tracing.log('debug', 'parsed', reason=reason, move=move_san(moves[0], position))
+        return moves[0]
 
     # --- 7. Fallback ---
     if DEBUG:
-        print(f"Couldn't parse command into a valid chess move: {command}")
-        print(f"Normalized command was: {normalized}")
-        print("Legal moves available:")
-        for move in board.legal_moves:
-            print(f" - {board.san(move)}")
+        tracing.log('debug', 'unparsed', command=command, normalized=normalized)
+    if TRACE:
+        tracing.log('trace', 'legal moves', moves=[move_san(move, position) for move in move_index(position).moves])
     
-    status_message = "Could not understand the move. Try again."
+    game_state.status_message = "Could not understand the move. Try again."
     return None
+
 def normalize_text(text):
-    replacements = {
-        'eh': 'a', 'ae': 'a', 'ay': 'a', 'ey': 'a', 'ei': 'a','yeah':'a','yay':'a','ye':'a',
-        'bee': 'b', 'be': 'b', 'bi': 'b', 'by': 'b', 'pee': 'b', 'pe': 'b',
-        'see': 'c', 'sea': 'c', 'si': 'c', 'cee': 'c', 
-        'dee': 'd', 'dey': 'd', 'di': 'd', 'the': 'd',
-        'ee': 'e', 'ie': 'e', 'ea': 'e', 'yi': 'e', 'ii': 'e',
-        'ef': 'f', 'aff': 'f', 'eaf': 'f', 'eff': 'f', 'afe': 'f','yes':'f',
-        'gee': 'g', 'ji': 'g', 'jee': 'g', 'gi': 'g',
-         'aitch': 'h', 'etch': 'h', 'age': 'h', 'ach': 'h', 'each': 'h','hedge':'h','hetch':'h','heich':'h',
-        'a': 'a', 'b': 'b', 'c': 'c','seems':'c', 'd': 'd', 'e': 'e', 'f': 'f', 'g': 'g', 'h': 'h',
-        'en': 'n', 'an': 'n', 'in': 'n', 'end': 'n', 'and': 'n', 'yen': 'n','then':'n','jan':'n','jen':'n',
-'are': 'r', 'our': 'r', 'or': 'r', 'arr': 'r', 'air': 'r',
-'queue': 'q', 'cu': 'q', 'que': 'q', 'cue': 'q', 'kyu': 'q','huh':'q','you':'q',
-'kay': 'k', 'ca': 'k', 'ka': 'k', 'key': 'k', 'cay': 'k',
-        
-        # Enhanced number recognition
-        'one': '1', 'van': '1', 'von': '1', 'won': '1', 'fun': '1', 'on': '1', 'run': '1', 'wine': '1', 'wan': '1',
-        'two': '2', 'to': '2', 'too': '2', 'do': '2', 'tu': '2', 'true': '2', 'tru': '2', 'due': '2', 'tools': '2',
-        'three': '3', 'tree': '3','they':'3', 'free': '3', 'sri': '3', 'pre': '3', 'flee': '3', 'the three': '3',
-        'four': '4','thought':'4', 'for': '4', 'far': '4', 'fore': '4', 'floor': '4', 'door': '4', 'more': '4', 'form': '4',
-        'five': '5', 'phi': '5', 'hive': '5', 'fife': '5', 'fight': '5', 'file': '5', 'find': '5','faill':'5','fame':'5',
-        'six': '6', 'sicks': '6', 'sticks': '6', 'sick': '6', 'sex': '6',
-        'seven': '7', 'savin': '7', 'heaven': '7', 'evan': '7', 'kevin': '7', 'eleven': '7',
-        'eight': '8', 'ate': '8', 'hate': '8', 'late': '8', 'date': '8', 'rate': '8', 'gate': '8','aight':'8',
-        
-        # Chess piece mappings (unchanged)
-        'pawn': 'pawn', 'porn': 'pawn', 'pond': 'pawn', 'bond': 'pawn',
-        'night': 'knight', 'knights': 'knight', 'knife': 'knight', 'knives': 'knight',
-        'bishop': 'bishop', 'shop': 'bishop', 'fish': 'bishop', 'dish': 'bishop',
-        'rook': 'rook', 'book': 'rook', 'brooke': 'rook', 'brook': 'rook', 'took': 'rook',
-        'queen': 'queen', 'clean': 'queen', 'cream': 'queen', 'screen': 'queen',
-        'king': 'king', 'ring': 'king', 'ping': 'king',
-        'capture': 'capture', 'captures': 'capture', 'takes': 'capture', 'take': 'capture',
-        'move': 'move', 'moves': 'move', 'moving': 'move',
-        'castle': 'castle', 'castles': 'castle', 'castling': 'castle', 'cassell': 'castle',
-        'castleside': 'castle kingside', 'castle side': 'castle kingside',
-        'kingside': 'kingside', 'king side': 'kingside', "king's side": 'kingside',
-        'queenside': 'queenside', 'queen side': 'queenside', "queen's side": 'queenside',
-        'short': 'kingside', 'short castle': 'castle kingside',
-        'long': 'queenside', 'long castle': 'castle queenside',
-        'promote': 'promote', 'promotion': 'promote',
-        'check': 'check',
-        
-        # Special case coordinate mappings
-        'e2e4': 'e2 to e4',
-        'e two e four': 'e2 to e4',
-        'e 2 e 4': 'e2 to e4',
-        'e two to e four': 'e2 to e4',
-    }
-    
-    normalized = text.lower()
-    if DEBUG:
-        print(f"Original text: '{text}'")
-        print(f"Lowercase text: '{normalized}'")
-    
-    for wrong, right in replacements.items():
-        normalized = re.sub(r'\b' + wrong + r'\b', right, normalized)
-    
-    isolated_letters = {
-        'ay': 'a', 'bee': 'b', 'see': 'c', 'dee': 'd', 
-        'ee': 'e', 'ef': 'f', 'gee': 'g', 'aitch': 'h'
-    }
-    
-    words = normalized.split()
-    for i, word in enumerate(words):
-        if len(word) <= 3:
-            for sound, letter in isolated_letters.items():
-                if sound == word:
-                    words[i] = letter
-                    if DEBUG:
-                        print(f"Replaced isolated '{word}' with '{letter}'")
-    
-    normalized = ' '.join(words)
-    
-    # Enhanced coordinate patterns
-    # First join letter-number pairs like "e 4" -> "e4"
-    coord_pattern = r'([a-h])\s*[-\s]*([1-8])'
-    normalized = re.sub(coord_pattern, r'\1\2', normalized)
-    
-    # Extended accent patterns
-    indian_accent_patterns = {
-        # e row
-        r'e do': 'e2', r'e to': 'e2', r'e too': 'e2', r'e two': 'e2', r'e tu': 'e2',
-        r'e tree': 'e3', r'e three': 'e3', r'e free': 'e3',
-        r'e for': 'e4', r'e four': 'e4', r'e far': 'e4', r'e floor': 'e4', 
-        r'e five': 'e5', r'e phi': 'e5',
-        r'e six': 'e6', r'e sicks': 'e6',
-        r'e seven': 'e7', r'e savin': 'e7',
-        r'e eight': 'e8', r'e ate': 'e8',
-        
-        # a row
-        r'a do': 'a2', r'a to': 'a2', r'a too': 'a2', r'a two': 'a2', r'a tu': 'a2',
-        r'a tree': 'a3', r'a three': 'a3', r'a free': 'a3',
-        r'a for': 'a4', r'a four': 'a4', r'a far': 'a4',
-        r'a five': 'a5', r'a phi': 'a5',
-        r'a six': 'a6', r'a sicks': 'a6',
-        r'a seven': 'a7', r'a savin': 'a7',
-        r'a eight': 'a8', r'a ate': 'a8',
-        
-        # b row
-        r'be do': 'b2', r'b do': 'b2', r'b to': 'b2', r'b too': 'b2', r'b two': 'b2',
-        r'be tree': 'b3', r'b tree': 'b3', r'b three': 'b3', r'b free': 'b3',
-        r'be for': 'b4', r'b for': 'b4', r'b four': 'b4', r'b far': 'b4',
-        r'be five': 'b5', r'b five': 'b5', r'b phi': 'b5',
-        r'be six': 'b6', r'b six': 'b6', r'b sicks': 'b6',
-        r'be seven': 'b7', r'b seven': 'b7', r'b savin': 'b7',
-        r'be eight': 'b8', r'b eight': 'b8', r'b ate': 'b8',
-        
-        # c row 
-        r'see do': 'c2', r'c do': 'c2', r'c to': 'c2', r'c too': 'c2', r'c two': 'c2',
-        r'see tree': 'c3', r'c tree': 'c3', r'c three': 'c3', r'c free': 'c3',
-        r'see for': 'c4', r'c for': 'c4', r'c four': 'c4', r'c far': 'c4',
-        r'see five': 'c5', r'c five': 'c5', r'c phi': 'c5',
-        r'see six': 'c6', r'c six': 'c6', r'c sicks': 'c6',
-        r'see seven': 'c7', r'c seven': 'c7', r'c savin': 'c7',
-        r'see eight': 'c8', r'c eight': 'c8', r'c ate': 'c8',
-        
-        # d row
-        r'de do': 'd2', r'd do': 'd2', r'd to': 'd2', r'd too': 'd2', r'd two': 'd2',
-        r'de tree': 'd3', r'd tree': 'd3', r'd three': 'd3', r'd free': 'd3',
-        r'de for': 'd4', r'd for': 'd4', r'd four': 'd4', r'd far': 'd4',
-        r'de five': 'd5', r'd five': 'd5', r'd phi': 'd5',
-        r'de six': 'd6', r'd six': 'd6', r'd sicks': 'd6',
-        r'de seven': 'd7', r'd seven': 'd7', r'd savin': 'd7',
-        r'de eight': 'd8', r'd eight': 'd8', r'd ate': 'd8',
-        
-        # g row
-        r'ge do': 'g2', r'g do': 'g2', r'g to': 'g2', r'g too': 'g2', r'g two': 'g2',
-        r'ge tree': 'g3', r'g tree': 'g3', r'g three': 'g3', r'g free': 'g3',
-        r'ge for': 'g4', r'g for': 'g4', r'g four': 'g4', r'g far': 'g4',
-        r'ge five': 'g5', r'g five': 'g5', r'g phi': 'g5',
-        r'ge six': 'g6', r'g six': 'g6', r'g sicks': 'g6',
-        r'ge seven': 'g7', r'g seven': 'g7', r'g savin': 'g7',
-        r'ge eight': 'g8', r'g eight': 'g8', r'g ate': 'g8',
-        
-        # h row
-        r'h do': 'h2', r'h to': 'h2', r'h too': 'h2', r'h two': 'h2',
-        r'h tree': 'h3', r'h three': 'h3', r'h free': 'h3',
-        r'h for': 'h4', r'h four': 'h4', r'h far': 'h4',
-        r'h five': 'h5', r'h phi': 'h5',
-        r'h six': 'h6', r'h sicks': 'h6',
-        r'h seven': 'h7', r'h savin': 'h7',
-        r'h eight': 'h8', r'h ate': 'h8',
-        
-        # f row
-        r'f do': 'f2', r'f to': 'f2', r'f too': 'f2', r'f two': 'f2',
-        r'f tree': 'f3', r'f three': 'f3', r'f free': 'f3',
-        r'f for': 'f4', r'f four': 'f4', r'f far': 'f4',
-        r'f five': 'f5', r'f phi': 'f5',
-        r'f six': 'f6', r'f sicks': 'f6',
-        r'f seven': 'f7', r'f savin': 'f7',
-        r'f eight': 'f8', r'f ate': 'f8',
-    }
-    
-    # Apply all the accent-specific patterns
-    for pattern, replacement in indian_accent_patterns.items():
-        normalized = normalized.replace(pattern, replacement)
-    
-    # Final pass to join any remaining coordinates like "e 4" -> "e4"
-    normalized = re.sub(r'([a-h])\s+([1-8])', r'\1\2', normalized)
-    
+    normalized = cached_normalize(text)
     
     if DEBUG:
-        print(f"Normalized: '{text}' -> '{normalized}'")
-        print(f"Words detected: {normalized.split()}")
+        tracing.log('debug', 'normalize', text=text, normalized=normalized)
     
     return normalized
 
+
 # Improved function to extract coordinate pairs from text
 def extract_coordinate_pairs(text):
     """Extract potential coordinate pairs from text with enhanced detection"""
@@ -833,7 +2135,7 @@ def extract_coordinate_pairs(text):
     if full_coords:
         coord_pairs.extend(full_coords)
         if DEBUG:
-            print(f"Found full coordinate pairs: {full_coords}")
+            tracing.log('debug', 'coordinate pairs', pairs=full_coords)
     
     # Detect separate coordinates that might form a pair
     coords = re.findall(r'[a-h][1-8]', text)
@@ -842,7 +2144,7 @@ def extract_coordinate_pairs(text):
         if coords[0] != coords[1]:
             coord_pairs.append((coords[0], coords[1]))
             if DEBUG:
-                print(f"Found separate coordinates that may form a pair: {coords[0]}, {coords[1]}")
+                tracing.log('debug', 'coordinate pair', start=coords[0], end=coords[1])
     
     return coord_pairs
 # Extract chess coordinates from text
@@ -851,74 +2153,249 @@ def extract_chess_coordinates(text):
     ranks = re.findall(r'\b([1-8])\b', text)
     
     if DEBUG:
-        if files:
-            print(f"Found potential files: {files}")
-        if ranks:
-            print(f"Found potential ranks: {ranks}")
+        tracing.log('debug', 'coordinate parts', files=files, ranks=ranks)
     
     if len(files) == 1 and len(ranks) == 1:
         coord = files[0] + ranks[0]
         if DEBUG:
-            print(f"Constructed coordinate from individual characters: {coord}")
+            tracing.log('debug', 'coordinate', coord=coord)
         return coord
     
     return None
 
 # Make a move on the chessboard
+def push_move(move):
+    """Play move on the board, keeping the redo stack in step, and append it to the journal"""
+    journal.apply_move(board, redo_stack, move)
+    if move_journal is not None:
+        move_journal.record_move(move)
+
+def position_changed():
+    """Work out what the new position needs before the next command: move index, book moves and tablebase verdict"""
+    # Legal moves and their groups are regenerated, but phrases of moves unchanged since the
+    # side's last turn come from move_phrase_cache, which is most of the index's cost
+    move_index()
+    book_suggestions()
+    request_tablebase_probe()
+
+class Speculation:
+    """Parse data for the position after a pending move, prepared on a worker thread during confirmation.
+    
+    Builds the move index, SAN of every legal move, game status and recognizer grammar on a
+    private board. commit() installs them into the position-keyed caches, now or as soon as the
+    worker finishes; discard() drops them.
+    """
+    
+    def __init__(self, position, move):
+        self.position = position.copy(stack=False)
+        self.position.push(move)
+        self.key = position_key(self.position)
+        self.results = None
+        self.state = 'pending'
+        self.lock = threading.Lock()
+        threading.Thread(target=self.run, daemon=True).start()
+    
+    def run(self):
+        position = self.position
+        index = MoveIndex(position)
+        sans = {move: position.san(move) for move in index.moves}
+        status = describe_status(position)
+        grammar = build_grammar(index) if USE_GRAMMAR else None
+        with self.lock:
+            self.results = (index, sans, status, grammar)
+            if self.state == 'committed':
+                self.install()
+    
+    def commit(self):
+        with self.lock:
+            self.state = 'committed'
+            if self.results is not None:
+                self.install()
+    
+    def discard(self):
+        with self.lock:
+            self.state = 'discarded'
+            self.results = None
+    
+    def install(self):
+        index, sans, status, grammar = self.results
+        move_index_cache.put(self.key, index)
+        for move, san in sans.items():
+            san_cache.put((self.key, move), san)
+        position_status_cache.put(self.key, status)
+        if grammar is not None:
+            grammar_cache.put(self.key, grammar)
+        if DEBUG:
+            tracing.log('debug', 'speculation committed', moves=len(sans))
+
+# Speculation for the move waiting for Y/N, if any
+speculation = None
+
+def speculate(move):
+    """Start preparing the position after move while the player decides whether to confirm it"""
+    global speculation
+    end_speculation(False)
+    speculation = Speculation(board, move)
+    if speech_process is not None:
+        speech_process.prepare(speculation.position)
+
+def end_speculation(confirmed):
+    global speculation
+    if speculation is not None:
+        if confirmed:
+            speculation.commit()
+        else:
+            speculation.discard()
+        speculation = None
+
 def make_move(move):
-    global status_message
     
     if isinstance(move, str):
         try:
             move_obj = board.parse_san(move)
-            board.push(move_obj)
-            status_message = f'Move executed: {move}'
-            print(status_message)
+            push_move(move_obj)
+            game_state.status_message = f'Move executed: {move}'
+            tracing.log('info', 'move', move=move)
+            position_changed()
             return move_obj
         except ValueError:
-            status_message = f'Invalid move: {move}'
-            print(status_message)
+            game_state.status_message = f'Invalid move: {move}'
+            tracing.log('warning', 'invalid move', move=move)
             return None
     elif isinstance(move, chess.Move):
         try:
-            san_move = board.san(move)
-            board.push(move)
-            status_message = f'Move executed: {san_move}'
-            print(status_message)
+            san_move = move_san(move)
+            push_move(move)
+            game_state.status_message = f'Move executed: {san_move}'
+            tracing.log('info', 'move', move=san_move)
+            # Index the new position now so the next command resolves with lookups only
+            position_changed()
             return move
         except ValueError:
-            status_message = "Invalid move"
-            print(status_message)
+            game_state.status_message = "Invalid move"
+            tracing.log('warning', 'invalid move', move=move.uci())
             return None
     
-    status_message = "Invalid move format"
+    game_state.status_message = "Invalid move format"
     return None
 
+def undo_move():
+    """Take back the last move, and the computer's reply before it, so the player is to move again.
+    
+    Returns the move now last on the board, or None.
+    """
+    if ai_engine is not None:
+        ai_engine.cancel()
+    undone = []
+    while board.move_stack:
+        move = board.pop()
+        redo_stack.append(move)
+        if move_journal is not None:
+            move_journal.record_undo()
+        undone.append(move_san(move))
+        if AI_COLOR is None or board.turn != AI_COLOR:
+            break
+    if not undone:
+        game_state.status_message = "Nothing to undo"
+        return None
+    position_changed()
+    game_state.status_message = f"Took back {', '.join(reversed(undone))}"
+    tracing.log('info', 'undo', moves=list(reversed(undone)))
+    request_ai_move()
+    return board.peek() if board.move_stack else None
+
+def redo_move():
+    """Replay the moves the last undo took back, up to the player's next turn"""
+    if not redo_stack:
+        game_state.status_message = "Nothing to redo"
+        return board.peek() if board.move_stack else None
+    if ai_engine is not None:
+        ai_engine.cancel()
+    redone = []
+    while redo_stack:
+        move = redo_stack[-1]
+        redone.append(move_san(move))
+        push_move(move)
+        if AI_COLOR is None or board.turn != AI_COLOR:
+            break
+    position_changed()
+    game_state.status_message = f"Replayed {', '.join(redone)}"
+    tracing.log('info', 'redo', moves=redone)
+    request_ai_move()
+    return board.peek()
+
+def new_game():
+    if ai_engine is not None:
+        ai_engine.cancel()
+    board.reset()
+    redo_stack.clear()
+    if move_journal is not None:
+        move_journal.start(board)
+    position_changed()
+    game_state.status_message = "New game. Press SPACE to speak a move"
+    request_ai_move()
+
+def export_pgn(path=PGN_PATH):
+    """Write the game so far as PGN"""
+    game = chess.pgn.Game.from_board(board)
+    game.headers['Event'] = 'Offline Voice Chess'
+    game.headers['Date'] = time.strftime('%Y.%m.%d')
+    if AI_COLOR is not None:
+        game.headers['White'] = 'Computer' if AI_COLOR == chess.WHITE else 'Player'
+        game.headers['Black'] = 'Computer' if AI_COLOR == chess.BLACK else 'Player'
+    try:
+        with open(path, 'w') as f:
+            print(game, file=f, end='\n\n')
+    except OSError as e:
+        game_state.status_message = f"Could not save game: {e}"
+        tracing.log('error', 'save failed', path=path, error=str(e))
+        return
+    game_state.status_message = f"Game saved to {os.path.basename(path)}"
+    tracing.log('info', 'game saved', path=path)
+
 # Show available legal moves
 def show_legal_moves():
-    moves = [board.san(move) for move in board.legal_moves]
-    print("Legal moves:", moves)
-    return moves
+    """Log the legal moves; SAN for every move is not free, so callers guard this with DEBUG"""
+    tracing.log('debug', 'legal moves', moves=[move_san(move) for move in move_index().moves])
+
+def request_ai_move():
+    """Start the engine on the current position if it is the computer's turn"""
+    if ai_engine is None or board.turn != AI_COLOR or board.is_game_over():
+        return
+    ai_engine.think(board, AI_TIME_BUDGET, AI_MAX_DEPTH)
+    game_state.status_message = "Computer is thinking..."
+
+def accept_ai_move(reply):
+    """The move from an ENGINE_EVENT reply, or None if the reply is stale or no longer legal"""
+    result = ai_engine.accept(reply)
+    if result is None or result['move'] not in board.legal_moves:
+        return None
+    if DEBUG:
+        if result['source'] in ('book', 'tablebase'):
+            tracing.log('debug', 'engine move', move=move_san(result['move']), source=result['source'])
+        else:
+            tracing.log('debug', 'engine move', move=move_san(result['move']), source=result['source'],
+                        depth=result['depth'], score=result['score'], nodes=result['nodes'],
+                        seconds=round(result['seconds'], 2))
+    return result['move']
 
 # Draw help overlay
-def draw_help_overlay():
-    overlay = pygame.Surface((WIDTH, HEIGHT))
-    overlay.set_alpha(230)
-    overlay.fill(WHITE)
-    screen.blit(overlay, (0, 0))
-    
-    font = pygame.font.Font(None, 30)
-    title_font = pygame.font.Font(None, 40)
+help_overlay = None
+
+def build_help_overlay():
+    """Compose the whole translucent help screen once so showing it costs a single blit"""
+    overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+    overlay.fill(WHITE + (230,))
     
-    title = title_font.render("Voice Command Help", True, BLACK)
-    screen.blit(title, (WIDTH//2 - title.get_width()//2, 20))
+    title = render_text("Voice Command Help", 40, BLACK)
+    overlay.blit(title, (WIDTH//2 - title.get_width()//2, 20))
     
     commands = [
         "Press SPACE to start listening",
-        "Press H to show/hide this help",
-        "Press ESC to quit",
-        "Press Y to confirm a move",
-        "Press N to reject a move",
+        "Press H for this help, ESC to quit",
+        "Press Y / N to confirm or reject a move",
+        "Press U / R to undo or redo, G for a new game",
+        "Press P to save the game as PGN, T for latencies",
         "",
         "Voice Command Examples:",
         "- \"e4\" (for pawn to e4)",
@@ -939,89 +2416,275 @@ def draw_help_overlay():
         if cmd == "":
             y += 20
             continue
-        text = font.render(cmd, True, BLACK)
-        screen.blit(text, (WIDTH//2 - text.get_width()//2, y))
+        text = get_font(30).render(cmd, True, BLACK)
+        overlay.blit(text, (WIDTH//2 - text.get_width()//2, y))
         y += 35
     
-    pygame.draw.rect(screen, (200, 200, 200), pygame.Rect(WIDTH - 100, HEIGHT - 50, 90, 40))
-    close_text = font.render("Close", True, BLACK)
-    screen.blit(close_text, (WIDTH - 55 - close_text.get_width()//2, HEIGHT - 30 - close_text.get_height()//2))
+    pygame.draw.rect(overlay, (200, 200, 200), pygame.Rect(WIDTH - 100, HEIGHT - 50, 90, 40))
+    close_text = render_text("Close", 30, BLACK)
+    overlay.blit(close_text, (WIDTH - 55 - close_text.get_width()//2, HEIGHT - 30 - close_text.get_height()//2))
+    return overlay
 
-# Main game loop
-def main():
-    global status_message, listening, recognized_text, pending_move, confirming_move
-    
-    model = setup_vosk()
-    if not model:
-        print("Failed to set up speech recognition. Exiting.")
-        pygame.quit()
-        sys.exit(1)
+def draw_help_overlay():
+    global help_overlay
     
-    speech_thread = threading.Thread(target=voice_listener_thread, args=(model,), daemon=True)
-    speech_thread.start()
+    if help_overlay is None:
+        help_overlay = build_help_overlay()
+    screen.blit(help_overlay, (0, 0))
+
+# Latency overlay, rebuilt whenever another trace finishes
+trace_overlay = None
+trace_overlay_version = None
+
+def build_trace_overlay():
+    """Per-stage percentiles of the traced utterances, each with a histogram of its durations"""
+    # Leaves the status lines below it visible
+    overlay = pygame.Surface((WIDTH, GAME_STATUS_RECT.y), pygame.SRCALPHA)
+    overlay.fill(WHITE + (230,))
+    summary = tracer.summary()
+    title = render_text(f"Latency of the last {len(tracer.traces)} utterances (ms)", 32, BLACK)
+    overlay.blit(title, (WIDTH//2 - title.get_width()//2, 15))
+    if not summary:
+        text = render_text("Press SPACE and speak a move to trace it", 28, BLACK)
+        overlay.blit(text, (WIDTH//2 - text.get_width()//2, 80))
+        return overlay
+    
+    bar_width = 9
+    histogram_x = WIDTH - 20 - bar_width * (len(tracing.BUCKET_EDGES_MS) + 1)
+    # Right edges of the number columns; the proportional font can't be aligned with spaces
+    columns = (('p50', 220), ('p90', 300), ('p99', 380), ('n', 440))
+    overlay.blit(render_text("stage", 24, BLUE), (15, 60))
+    for name, right in columns:
+        text = render_text(name, 24, BLUE)
+        overlay.blit(text, (right - text.get_width(), 60))
+    y = 90
+    for stage in tracing.STAGES[1:] + ('total',):
+        if stage not in summary:
+            continue
+        stats = summary[stage]
+        overlay.blit(render_text(stage, 24, BLACK), (15, y + 8))
+        for (name, right), value in zip(columns, (f"{stats['p50']:.1f}", f"{stats['p90']:.1f}", f"{stats['p99']:.1f}", str(stats['count']))):
+            text = render_text(value, 24, BLACK)
+            overlay.blit(text, (right - text.get_width(), y + 8))
+        tallest = max(stats['histogram'])
+        for bucket, count in enumerate(stats['histogram']):
+            height = int(28 * count / tallest)
+            pygame.draw.rect(overlay, GREEN, pygame.Rect(histogram_x + bucket * bar_width, y + 30 - height, bar_width - 1, height))
+        y += 40
+    edges = render_text(f"buckets up to {', '.join(map(str, tracing.BUCKET_EDGES_MS))} ms", 20, BLACK)
+    overlay.blit(edges, (15, y + 10))
+    return overlay
+
+def draw_trace_overlay():
+    global trace_overlay, trace_overlay_version
     
-    last_move = None
-    clock = pygame.time.Clock()
+    if trace_overlay is None or trace_overlay_version != tracer.version:
+        trace_overlay = build_trace_overlay()
+        trace_overlay_version = tracer.version
+    screen.blit(trace_overlay, (0, 0))
+
+def export_traces():
+    """Write the session's traces as JSON and CSV and log the end-to-end percentiles"""
+    if not tracer.traces:
+        return
+    try:
+        tracer.export_json(TRACE_JSON_PATH)
+        tracer.export_csv(TRACE_CSV_PATH)
+    except OSError as e:
+        tracing.log('error', 'trace export failed', error=str(e))
+        return
+    total = tracer.summary()['total']
+    tracing.log('info', 'latency', utterances=total['count'], p50_ms=round(total['p50'], 1),
+                p99_ms=round(total['p99'], 1), json=TRACE_JSON_PATH, csv=TRACE_CSV_PATH)
+
+# Main game loop
+def main():
+    global screen
+    global ai_engine, opening_book, tablebase, tablebase_max_pieces, move_journal, speech_process
+    
+    # Initialize Pygame and set up the display
+    phase_start = time.perf_counter()
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption('Offline Voice Chess')
+    startup_timings['pygame init'] = time.perf_counter() - phase_start
+    
+    # Pick the game up where the journal left it
+    move_journal = journal.Journal(JOURNAL_PATH)
+    redo = move_journal.resume(board)
+    if redo is None:
+        move_journal.start(board)
+    else:
+        redo_stack[:] = redo
+        game_state.status_message = f"Resumed game after {len(board.move_stack)} moves"
+        tracing.log('info', 'resumed', moves=len(board.move_stack))
+    
+    # The window comes up straight away; the model loads in the speech process
+    update_recognizer_grammar()
+    speech_process = SpeechProcess(audio_ring)
+    speech_process.start()
+    speech_process.prepare(board)
+    book_path = get_book_path()
+    opening_book = open_opening_book(book_path)
+    tablebase_path = get_tablebase_path()
+    tablebase = open_tablebase(tablebase_path)
+    if tablebase is not None:
+        tablebase_max_pieces = engine.tablebase_max_pieces(tablebase)
+        threading.Thread(target=tablebase_thread, daemon=True).start()
+        request_tablebase_probe()
+    if AI_COLOR is not None:
+        ai_engine = engine.EngineProcess(book_path if opening_book else None, tablebase_path if tablebase else None)
+        ai_engine.start()
+        request_ai_move()
+    
+    # Results from the speech and engine processes wake the main loop as events
+    threading.Thread(target=relay_thread, args=(speech_process.results, SPEECH_EVENT), daemon=True).start()
+    if ai_engine is not None:
+        threading.Thread(target=relay_thread, args=(ai_engine.replies, ENGINE_EVENT), daemon=True).start()
+    # Pointer movement changes nothing on screen; don't wake up for it
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
+    
+    last_move = board.peek() if board.move_stack else None
     running = True
     show_help = True
+    show_trace = False
+    previous_state = None
+    full_redraw = True
     
-    print("Current board state:")
-    print(board)
-    legal_moves = show_legal_moves()
+    if DEBUG:
+        tracing.log('debug', 'board', fen=board.fen())
+        show_legal_moves()
     
     while running:
-        for event in pygame.event.get():
+        # Sleep until something happens, or the next countdown tick while one is showing
+        for event in [pygame.event.wait(wait_timeout())] + pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                full_redraw = True
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     running = False
                 elif event.key == pygame.K_SPACE:
-                    if not listening and not confirming_move:
-                        listening = True
-                        recognized_text = ""
-                        status_message = "Listening for move..."
-                        print("Listening for command...")
+                    ai_thinking = ai_engine is not None and ai_engine.thinking
+                    if game_state.model_state == 'ready' and not game_state.listening and not game_state.confirming_move and not ai_thinking:
+                        if TRACING:
+                            tracer.begin()
+                        game_state.update(listening=True, listen_start_time=time.time(), audio_level=0.0,
+                                          recognized_text="", status_message="Listening for move...")
+                        speech_process.listen(board)
+                        if DEBUG:
+                            tracing.log('debug', 'listening')
                 elif event.key == pygame.K_h:
                     show_help = not show_help
-                elif event.key == pygame.K_y and confirming_move:
-                    if pending_move:
-                        last_move = make_move(pending_move)
-                        pending_move = None
-                        confirming_move = False
-                        legal_moves = show_legal_moves()
-                elif event.key == pygame.K_n and confirming_move:
-                    pending_move = None
-                    confirming_move = False
-                    status_message = "Move rejected. Press SPACE to try again."
+                elif event.key == pygame.K_t:
+                    show_trace = not show_trace
+                elif event.key == pygame.K_y and game_state.confirming_move:
+                    if game_state.pending_move:
+                        tracer.mark('confirm')
+                        tracer.finish('confirmed')
+                        end_speculation(True)
+                        last_move = make_move(game_state.pending_move)
+                        game_state.update(pending_move=None, confirming_move=False)
+                        request_ai_move()
+                        if DEBUG:
+                            show_legal_moves()
+                        update_recognizer_grammar()
+                elif event.key == pygame.K_n and game_state.confirming_move:
+                    tracer.finish('rejected')
+                    end_speculation(False)
+                    game_state.update(pending_move=None, confirming_move=False,
+                                      status_message="Move rejected. Press SPACE to try again.")
+                elif event.key in (pygame.K_u, pygame.K_r, pygame.K_g) and not game_state.listening:
+                    tracer.finish('rejected')
+                    end_speculation(False)
+                    game_state.update(pending_move=None, confirming_move=False)
+                    if event.key == pygame.K_u:
+                        last_move = undo_move()
+                    elif event.key == pygame.K_r:
+                        last_move = redo_move()
+                    else:
+                        new_game()
+                        last_move = None
+                    if DEBUG:
+                        show_legal_moves()
+                    update_recognizer_grammar()
+                elif event.key == pygame.K_p:
+                    export_pgn()
             if event.type == pygame.MOUSEBUTTONDOWN and show_help:
                 if WIDTH - 100 <= event.pos[0] <= WIDTH - 10 and HEIGHT - 50 <= event.pos[1] <= HEIGHT - 10:
                     show_help = False
+            if event.type == ENGINE_EVENT:
+                ai_move = accept_ai_move(event.message)
+                if ai_move:
+                    last_move = make_move(ai_move)
+                    if DEBUG:
+                        show_legal_moves()
+                    update_recognizer_grammar()
+            if event.type == SPEECH_EVENT:
+                kind, value = event.message
+                if kind == 'level':
+                    game_state.audio_level = value
+                elif kind == 'trace':
+                    tracer.merge(value)
+                elif kind == 'text':
+                    if DEBUG:
+                        tracing.log('debug', 'recognized', text=value)
+                    game_state.recognized_text = value
+                    if not value.startswith("Partial:"):
+                        tracer.mark('deliver')
+                        move = parse_command(value)
+                        if move:
+                            game_state.update(pending_move=move, confirming_move=True,
+                                              status_message="Confirm this move? (Y/N)")
+                            speculate(move)
+                elif kind == 'done':
+                    game_state.listening = False
+                    if not game_state.confirming_move:
+                        tracer.finish('no move')
+                elif kind == 'ready':
+                    startup_timings.update(value)
+                    print_startup_report()
+                    game_state.update(model_state='ready', status_message="Press SPACE to speak a move")
+                elif kind == 'failed':
+                    tracer.finish('no move')
+                    game_state.update(model_state='failed', listening=False, status_message=value)
         
-        try:
-            if not speech_queue.empty():
-                command = speech_queue.get_nowait()
-                print(f"Recognized: {command}")
-                recognized_text = command
-                if not command.startswith("Partial:"):
-                    move = parse_command(command)
-                    if move:
-                        pending_move = move
-                        confirming_move = True
-                        status_message = "Confirm this move? (Y/N)"
-        except queue.Empty:
-            pass
-        
-        screen.fill(WHITE)
-        draw_board(last_move)
-        draw_pieces()
-        draw_status()
-        if show_help:
-            draw_help_overlay()
+        # Don't stay in listening mode if the speech process died or never answered
+        if game_state.listening and listening_stalled():
+            tracer.finish('no move')
+            if speech_process.process.is_alive():
+                tracing.log('warning', 'listening abandoned', reason='no reply')
+                speech_process.cancel()
+                game_state.update(listening=False, status_message="No answer from speech recognition. Try again.")
+            else:
+                tracing.log('error', 'listening abandoned', reason='speech process exited',
+                            exitcode=speech_process.process.exitcode)
+                game_state.update(model_state='failed', listening=False,
+                                  status_message="Speech recognition stopped. See console for details.")
         
-        pygame.display.flip()
-        clock.tick(30)
+        # Only push the regions that changed since the last frame
+        state = frame_state(last_move, show_help, show_trace)
+        rects = dirty_rects(None if full_redraw else previous_state, state)
+        for rect in rects:
+            draw_scene(state, last_move, rect)
+        if rects:
+            pygame.display.update(rects)
+        previous_state = state
+        full_redraw = False
+        move_journal.maybe_sync()
 
+    if DEBUG:
+        print_cache_report()
+    export_traces()
+    speech_process.close()
+    if ai_engine is not None:
+        ai_engine.close()
+    if opening_book is not None:
+        opening_book.close()
+    move_journal.close()
+    if tablebase is not None:
+        tablebase.close()
     pygame.quit()
     sys.exit()
 
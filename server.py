@@ -0,0 +1,202 @@
+"""Headless multi-session server for Offline Voice Chess.
+
+Loads the Vosk model once and hosts many games over a local socket. Each connection
+is one session with its own recognizer, board and parser state. An asyncio loop
+handles the sockets and hands decoding to a thread pool sized to the cores.
+
+Every message is a 1-byte type, a 4-byte big-endian payload length and the payload.
+Client to server:
+    S  start an utterance (empty payload)
+    A  audio: 16 kHz mono 16-bit little-endian PCM
+    E  end of the utterance; answered with {"text", "normalized", "move", "san"}
+    M  play a move given in UCI; answered with {"fen", "status"} or {"error"}
+    P  set the position from a FEN, empty for the start position; answered like M
+    I  server statistics; answered with {"sessions", "workers", "rss_kb"}
+Server to client:
+    J  a JSON reply
+
+    python server.py --model path/to/vosk-model --port 8765
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import struct
+
+import chess
+import vosk
+
+import second
+import tracing
+
+FRAME_HEADER = struct.Struct('>cI')
+# Largest payload accepted; audio is sent in chunks well below this
+MAX_PAYLOAD = 1 << 20
+# Entries each live session keeps in second's position caches: the index and grammar of its
+# position and the one it just left, and the parses of an utterance's alternatives and partials
+CACHE_ENTRIES_PER_SESSION = {'move_index_cache': 2, 'grammar_cache': 2, 'parse_cache': 32}
+
+async def read_message(reader):
+    kind, length = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    if length > MAX_PAYLOAD:
+        raise ValueError(f"payload of {length} bytes is too large")
+    return kind, await reader.readexactly(length)
+
+def write_message(writer, kind, payload=b''):
+    writer.write(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+def write_json(writer, value):
+    write_message(writer, b'J', json.dumps(value).encode('utf-8'))
+
+def size_caches(sessions):
+    """Grow second's position caches so that many sessions don't evict each other's entries"""
+    for name, entries in CACHE_ENTRIES_PER_SESSION.items():
+        cache = getattr(second, name)
+        cache.maxsize = max(cache.maxsize, sessions * entries)
+
+def resident_kb():
+    """Resident memory of this process in KB, where /proc is available"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+class Session:
+    """One game: a recognizer on the shared model, a board and the text of the current utterance.
+
+    Recognizer calls run on the worker pool, one at a time per session.
+    """
+
+    def __init__(self, model):
+        self.board = chess.Board()
+        self.grammar = second.move_grammar(self.board) if second.USE_GRAMMAR else None
+        if self.grammar:
+            self.rec = vosk.KaldiRecognizer(model, second.SAMPLE_RATE, self.grammar)
+        else:
+            self.rec = vosk.KaldiRecognizer(model, second.SAMPLE_RATE)
+        self.rec.SetWords(True)
+        self.rec.SetMaxAlternatives(second.MAX_ALTERNATIVES)
+        self.final_text = ""
+
+    def start_utterance(self):
+        # Grammars are cached by position, so sessions in the same position share one
+        if second.USE_GRAMMAR:
+            grammar = second.move_grammar(self.board)
+            if grammar != self.grammar:
+                self.grammar = grammar
+                self.rec.SetGrammar(grammar)
+        self.rec.Reset()
+        self.final_text = ""
+
+    def accept(self, audio):
+        if self.rec.AcceptWaveform(audio) and not self.final_text:
+            self.final_text = second.best_alternative(json.loads(self.rec.Result()), self.board)
+
+    def finish(self):
+        text = self.final_text or second.best_alternative(json.loads(self.rec.FinalResult()), self.board)
+        normalized = second.cached_normalize(second.filter_repeated_words(text))
+        moves, _ = second.command_candidates(normalized, self.board)
+        move = moves[0] if moves else None
+        return {
+            'text': text,
+            'normalized': normalized,
+            'move': move.uci() if move else None,
+            'san': second.move_san(move, self.board) if move else None,
+        }
+
+    def play(self, uci):
+        try:
+            move = chess.Move.from_uci(uci)
+        except ValueError:
+            return {'error': f"invalid move {uci!r}"}
+        if not self.board.is_legal(move):
+            return {'error': f"illegal move {uci}"}
+        self.board.push(move)
+        return self.position()
+
+    def set_position(self, fen):
+        try:
+            self.board = chess.Board(fen or chess.STARTING_FEN)
+        except ValueError as e:
+            return {'error': str(e)}
+        return self.position()
+
+    def position(self):
+        return {'fen': self.board.fen(), 'status': second.game_status(self.board)}
+
+class VoiceChessServer:
+    def __init__(self, model, workers):
+        self.model = model
+        self.workers = workers
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.sessions = set()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        session = await loop.run_in_executor(self.pool, Session, self.model)
+        self.sessions.add(session)
+        try:
+            while True:
+                try:
+                    kind, payload = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                if kind == b'A':
+                    await loop.run_in_executor(self.pool, session.accept, payload)
+                elif kind == b'S':
+                    await loop.run_in_executor(self.pool, session.start_utterance)
+                elif kind == b'E':
+                    write_json(writer, await loop.run_in_executor(self.pool, session.finish))
+                elif kind == b'M':
+                    write_json(writer, session.play(payload.decode('ascii', 'replace')))
+                elif kind == b'P':
+                    write_json(writer, session.set_position(payload.decode('ascii', 'replace')))
+                elif kind == b'I':
+                    write_json(writer, {'sessions': len(self.sessions), 'workers': self.workers, 'rss_kb': resident_kb()})
+                else:
+                    write_json(writer, {'error': f"unknown message type {kind!r}"})
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            if second.DEBUG:
+                tracing.log('debug', 'session ended', error=str(e))
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+async def serve(args):
+    print(f"Loading model from {args.model}")
+    model = vosk.Model(args.model)
+    size_caches(args.sessions)
+    server = VoiceChessServer(model, args.workers)
+    listener = await asyncio.start_server(server.handle, args.host, args.port)
+    print(f"Serving on {args.host}:{args.port} with {args.workers} decoding workers")
+    async with listener:
+        await listener.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=second.get_model_path(), help='Vosk model directory')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='decoding threads')
+    parser.add_argument('--sessions', type=int, default=64, help='concurrent games to size the caches for')
+    args = parser.parse_args()
+
+    second.DEBUG = False
+    vosk.SetLogLevel(-1)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
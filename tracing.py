@@ -0,0 +1,135 @@
+"""Per-utterance latency tracing and leveled, structured logging for Offline Voice Chess.
+
+A trace stamps one utterance at each stage of the pipeline, from the key press to the
+confirmation. Stamps are time.perf_counter() values, which are system-wide on Linux,
+macOS and Windows, so the speech process can stamp its stages of the same utterance.
+Tracer keeps a rolling window of finished traces and summarizes it as per-stage
+percentiles and histograms, exported as JSON or CSV.
+
+Log records are an event name plus key=value fields. Records below the level are dropped
+before formatting; hot paths also guard the call with a flag from enabled(), so a disabled
+level costs one global lookup.
+"""
+import collections
+import csv
+import json
+import multiprocessing
+import time
+
+# Pipeline stages in order; each one's duration runs from the previous stamped stage
+# 'deliver' is the hop of the normalized text from the speech process to the main loop
+STAGES = ('key', 'voiced', 'endpoint', 'final', 'filter', 'normalize', 'deliver', 'parse', 'confirm')
+# Upper bucket edges of the histograms in milliseconds; a last bucket holds everything slower
+BUCKET_EDGES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+TRACE_WINDOW = 500
+
+LEVELS = {'error': 40, 'warning': 30, 'info': 20, 'debug': 10, 'trace': 5}
+threshold = LEVELS['info']
+
+def set_level(name):
+    """Set the level by name; an unknown name warns and falls back to 'info'"""
+    global threshold
+    if name.lower() not in LEVELS:
+        threshold = LEVELS['info']
+        log('warning', 'unknown log level', name=name, using='info', choices=', '.join(LEVELS))
+        return
+    threshold = LEVELS[name.lower()]
+
+def enabled(level):
+    return LEVELS[level] >= threshold
+
+def log(level, event, **fields):
+    """Print one record: level, process, event and its fields as key=value"""
+    if LEVELS[level] < threshold:
+        return
+    process = multiprocessing.current_process().name
+    print(' '.join([f"[{level}]", process, event] + [f"{key}={value!r}" for key, value in fields.items()]))
+
+def stamp(marks, stage):
+    """Record the first time stage is reached in a marks dict; None marks are not traced"""
+    if marks is not None and stage not in marks:
+        marks[stage] = time.perf_counter()
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def describe(values):
+    """Count, percentiles and histogram of durations in milliseconds"""
+    values = sorted(values)
+    histogram = [0] * (len(BUCKET_EDGES_MS) + 1)
+    bucket = 0
+    for value in values:
+        while bucket < len(BUCKET_EDGES_MS) and value > BUCKET_EDGES_MS[bucket]:
+            bucket += 1
+        histogram[bucket] += 1
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 0.50),
+        'p90': percentile(values, 0.90),
+        'p99': percentile(values, 0.99),
+        'max': values[-1],
+        'histogram': histogram,
+    }
+
+class Tracer:
+    """Stamps of the utterance in progress and a rolling window of finished traces.
+
+    Used from the main loop only; the speech process stamps a plain dict that is merged in.
+    """
+
+    def __init__(self, window=TRACE_WINDOW):
+        self.traces = collections.deque(maxlen=window)
+        self.current = None
+        # Bumped whenever a trace finishes, so views of the summary know when to rebuild
+        self.version = 0
+
+    def begin(self):
+        self.current = {'key': time.perf_counter()}
+
+    def mark(self, stage):
+        stamp(self.current, stage)
+
+    def merge(self, marks):
+        if self.current is not None:
+            for stage, when in marks.items():
+                self.current.setdefault(stage, when)
+
+    def finish(self, outcome):
+        """Close the current trace as 'confirmed', 'rejected' or 'no move'; without one this does nothing"""
+        if self.current is None:
+            return
+        start = self.current['key']
+        offsets = {stage: (when - start) * 1000.0 for stage, when in self.current.items()}
+        self.traces.append((outcome, offsets))
+        self.current = None
+        self.version += 1
+
+    def summary(self):
+        """describe() of every stage's duration over the window, plus 'total' from key press to the last stage before confirm"""
+        durations = {stage: [] for stage in STAGES[1:] + ('total',)}
+        for outcome, offsets in self.traces:
+            previous = 0.0
+            for stage in STAGES[1:]:
+                if stage in offsets:
+                    durations[stage].append(offsets[stage] - previous)
+                    if stage != 'confirm':
+                        previous = offsets[stage]
+            durations['total'].append(previous)
+        return {stage: describe(values) for stage, values in durations.items() if values}
+
+    def export_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'bucket_edges_ms': BUCKET_EDGES_MS,
+                'stages': self.summary(),
+                'traces': [dict(offsets, outcome=outcome) for outcome, offsets in self.traces],
+            }, f, indent=2)
+
+    def export_csv(self, path):
+        """One row per trace: the outcome and each stage's offset from the key press in milliseconds"""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('outcome',) + STAGES)
+            for outcome, offsets in self.traces:
+                writer.writerow([outcome] + [f"{offsets[stage]:.2f}" if stage in offsets else '' for stage in STAGES])